@@ -0,0 +1,118 @@
+import argparse
+
+from classes import (
+    Bin,
+    Batch,
+    Defect,
+    InstanceBounds,
+    GlobalParams,
+    DEFAULT_PARAMS,
+    merge_open_intervals,
+)
+from input_output import read_instance
+
+
+def analyze(
+    id: str = "A1", base_path: str = "datasets", params: GlobalParams = DEFAULT_PARAMS
+) -> InstanceBounds:
+    """
+    Reads an instance, and returns its lower bounds.
+
+    Parameters:
+        id (str): Instance ID (e.g., "A1").
+        base_path (str): Path to the main datasets folder.
+        params (GlobalParams): Global parameters of the problem.
+
+    Returns:
+        InstanceBounds: The lower bounds of the instance.
+    """
+    bins, batch = read_instance(id, base_path, params=params)
+    return analyze_instance(bins, batch, params)
+
+
+def analyze_instance(
+    bins: list[Bin], batch: Batch, params: GlobalParams = DEFAULT_PARAMS
+) -> InstanceBounds:
+    """
+    Computes the lower bounds of an instance from the areas of its items and bins.
+
+    The plates of a solution are the first bins in order, and the items can not
+    cover the defects, so at least the first min_plates bins are used, where the
+    defect-free area of the bins reaches the area of the items. The used plates
+    but the last are wasted fully, besides their items, and the last one up to
+    its residual, a 1-cut strip at its right side. So the objective function is
+    at least the area of the first min_plates - 1 plates, and the narrowest strip
+    of the last plate holding the rest of the items, minus the area of the items.
+    More plates can not give less, as the last plate is at most a full plate.
+
+    Parameters:
+        bins (list[Bin]): Bins of the instance, in the order of their use.
+        batch (Batch): Stacks of the instance.
+        params (GlobalParams): Global parameters of the problem.
+
+    Returns:
+        InstanceBounds: The lower bounds of the instance.
+
+    Raises:
+        ValueError: If the items do not fit into the defect-free area of the bins.
+    """
+    items = [item for stack in batch.stacks for item in stack.sequence]
+    item_area = sum(item.width * item.length for item in items)
+    plate_area = params.width_plates * params.height_plates
+
+    # Defect-free area of the plates before the last one
+    usable_area = defect_area = 0
+    for plates, bin in enumerate(bins, 1):
+        bin_defect_area = covered_area(bin.defects)
+        defect_area += bin_defect_area
+        if usable_area + plate_area - bin_defect_area >= item_area:
+            break
+        usable_area += plate_area - bin_defect_area
+    else:
+        raise ValueError(
+            f"The items of area {item_area} do not fit into the {len(bins)} bins"
+        )
+
+    # Ceiling division, the strip is a whole number of units wide
+    strip_width = -(-(item_area - usable_area) // params.height_plates)
+    waste = (plates - 1) * plate_area + strip_width * params.height_plates - item_area
+    return InstanceBounds(len(items), item_area, defect_area, plates, waste)
+
+
+def covered_area(defects: list[Defect]) -> int:
+    """
+    Returns the area covered by the defects, where an overlap is counted once.
+    """
+    xs = sorted({x for defect in defects for x in (defect.x, defect.x + defect.width)})
+    area = 0
+    # The defects covering a slab between consecutive x coordinates cover all of it
+    for x_low, x_high in zip(xs, xs[1:]):
+        starts, ends = merge_open_intervals(
+            (defect.y, defect.y + defect.height)
+            for defect in defects
+            if defect.x <= x_low and x_high <= defect.x + defect.width
+        )
+        area += (x_high - x_low) * sum(end - start for start, end in zip(starts, ends))
+    return area
+
+
+def gap(waste: int, lower_bound: int) -> float:
+    """
+    Returns the gap of a solution to the lower bound, in percent of its waste.
+    It is 0 for a solution reaching the bound, so an optimal solution.
+    """
+    return round(100 * (waste - lower_bound) / waste, 4) if waste else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lower bounds of instances.")
+    parser.add_argument("instances", nargs="+", help="e.g. A1 A2 B1")
+    args = parser.parse_args()
+
+    print(f"{'ID':<5}{'Items':>7}{'Item area':>14}{'Min plates':>12}{'Waste':>12}")
+    for id in args.instances:
+        bounds = analyze(id)
+        print(
+            f"{id:<5}{bounds.items:>7}{bounds.item_area:>14}"
+            f"{bounds.min_plates:>12}{bounds.waste:>12}"
+        )
@@ -0,0 +1,259 @@
+import os
+import csv
+import json
+import argparse
+import platform
+import resource
+import subprocess
+from datetime import datetime
+from functools import partial
+from multiprocessing import Pool
+from time import perf_counter
+
+import solve
+from analyze import analyze_instance, gap
+from classes import SolverContext
+from input_output import read_instance
+from main import dataset_instances
+from validate import validate_solution
+
+RESULTS_DIR = "benchmarks"
+FIELDS = ["ID", "Runtime", "Waste", "Plates", "Gap", "Nodes", "PeakMemory", "Valid"]
+
+
+def run_benchmark(
+    solver: str = "backtrack_solve",
+    params: dict | None = None,
+    instances: list[str] | None = None,
+    name: str | None = None,
+    results_dir: str = RESULTS_DIR,
+    baseline: str | None = None,
+) -> str:
+    """
+    Runs a solver configuration on the instances, and stores the results in
+    a new run directory of results_dir.
+
+    Every instance is solved in a fresh worker process, so the peak memory
+    belongs to that instance only.
+
+    Parameters:
+        solver (str): Name of the solver function in solve.py.
+        params (dict): Keyword arguments of the solver, besides the instance ID.
+        instances (list[str]): Instance IDs, all of datasets A, B and X by default.
+        name (str): Name of the configuration, the solver's name by default.
+        results_dir (str): Directory of the runs.
+        baseline (str): Run directory to compare the results with, if given.
+
+    Returns:
+        str: The run directory, named by the start time, the git commit and the name.
+    """
+    params = params or {}
+    if instances is None:
+        instances = [id for dataset in "ABX" for id in dataset_instances(dataset)]
+
+    commit = git_commit()
+    started = datetime.now()
+    run_dir = os.path.join(
+        results_dir, f"{started:%Y%m%d-%H%M%S}-{commit}-{name or solver}"
+    )
+    os.makedirs(run_dir)
+
+    with open(os.path.join(run_dir, "config.json"), "w") as file:
+        json.dump(
+            {
+                "solver": solver,
+                "params": params,
+                "instances": instances,
+                "commit": commit,
+                "started": started.isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+            },
+            file,
+            indent=4,
+        )
+
+    print(f"Started benchmark {run_dir}")
+    rows = []
+    with Pool(processes=1, maxtasksperchild=1) as pool:
+        for row in pool.imap(partial(benchmark_instance, solver, params), instances):
+            rows.append(row)
+            print(
+                f"\t{row['ID']}: {row['Runtime']} s, waste {row['Waste']}%, "
+                f"{row['Plates']} plates, gap {row['Gap']}%, {row['Nodes']} nodes, "
+                f"{row['PeakMemory']} MB" + ("" if row["Valid"] else ", INVALID")
+            )
+            # Keep the results of the finished instances, if the run is stopped
+            write_results(os.path.join(run_dir, "results.csv"), rows)
+
+    if baseline is not None:
+        compare_runs(run_dir, baseline)
+
+    return run_dir
+
+
+def benchmark_instance(solver: str, params: dict, id: str) -> dict:
+    """
+    Solves an instance with the solver, and measures it. Runs in a worker process.
+
+    Returns:
+        dict: The result row of the instance, with the keys of FIELDS.
+    """
+    start_time = perf_counter()
+    bins, batch = read_instance(id)
+    # Without events, so without the messages and the loading bar of the solver
+    context = SolverContext(id, bins, batch, bounds=analyze_instance(bins, batch))
+    trees = getattr(solve, solver)(id, context=context, **params)
+    runtime = perf_counter() - start_time
+
+    return {
+        "ID": id,
+        "Runtime": round(runtime, 2),
+        "Waste": solve.waste_proportion(trees),
+        "Plates": len(trees),
+        # Gap of the objective function to the lower bound of the instance
+        "Gap": gap(solve.objective_function(trees), context.bounds.waste),
+        "Nodes": context.expanded_nodes,
+        # Maximum resident set size of the process, in kilobytes on Linux
+        "PeakMemory": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024),
+        "Valid": int(validate_solution(trees, id).valid),
+    }
+
+
+def write_results(filename: str, rows: list[dict]):
+    """
+    Writes the result rows of a run into a csv file.
+    """
+    with open(filename, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def read_results(run: str) -> dict[str, dict]:
+    """
+    Reads the result rows of a run directory, or of a csv file in the format of
+    write_to_csv (ID, Runtime, Waste), like the hand-written result files.
+
+    Returns:
+        dict[str, dict]: The rows by instance ID, with the missing fields as None.
+    """
+    filename = os.path.join(run, "results.csv") if os.path.isdir(run) else run
+    with open(filename, newline="") as file:
+        rows = {}
+        for row in csv.DictReader(file):
+            rows[row["ID"]] = {
+                field: (
+                    row[field]
+                    if field == "ID"
+                    else float(row[field]) if row.get(field) else None
+                )
+                for field in FIELDS
+            }
+    return rows
+
+
+def compare_runs(run: str, baseline: str, runtime_tolerance: float = 0.1) -> list[str]:
+    """
+    Prints the difference of each instance between a run and a baseline run,
+    and marks the regressions: slower by more than runtime_tolerance (ratio),
+    more waste, more plates, or an invalid solution.
+
+    Returns:
+        list[str]: The IDs of the instances with a regression.
+    """
+    rows = read_results(run)
+    base_rows = read_results(baseline)
+    regressions = []
+
+    print(f"Comparing {run} with {baseline}")
+    print(f"\t{'ID':<5}{'Runtime':>24}{'Waste':>28}{'Plates':>12}")
+    for id, row in rows.items():
+        base = base_rows.get(id)
+        if base is None:
+            print(f"\t{id:<5} not in the baseline")
+            continue
+
+        marks = []
+        # Differences under 0.05 s are noise
+        if (
+            row["Runtime"] > base["Runtime"] * (1 + runtime_tolerance)
+            and row["Runtime"] - base["Runtime"] >= 0.05
+        ):
+            marks.append("SLOWER")
+        if row["Waste"] > base["Waste"]:
+            marks.append("MORE WASTE")
+        if None not in (row["Plates"], base["Plates"]):
+            if row["Plates"] > base["Plates"]:
+                marks.append("MORE PLATES")
+        if row["Valid"] == 0:
+            marks.append("INVALID")
+        if marks:
+            regressions.append(id)
+
+        speedup = base["Runtime"] / row["Runtime"] if row["Runtime"] else float("inf")
+        plates = (
+            f"{base['Plates']:.0f} -> {row['Plates']:.0f}"
+            if None not in (row["Plates"], base["Plates"])
+            else "-"
+        )
+        print(
+            f"\t{id:<5}"
+            f"{base['Runtime']:>9.2f} -> {row['Runtime']:<7.2f}({speedup:.2f}x)"
+            f"{base['Waste']:>10.4f} -> {row['Waste']:<8.4f}"
+            f"({row['Waste'] - base['Waste']:+.4f})"
+            f"{plates:>12}  {' '.join(marks)}"
+        )
+
+    total = sum(row["Runtime"] for id, row in rows.items() if id in base_rows)
+    base_total = sum(base_rows[id]["Runtime"] for id in rows if id in base_rows)
+    print(f"\tTotal runtime: {base_total:.2f} -> {total:.2f} s")
+    print(f"\tRegressions: {', '.join(regressions) if regressions else 'none'}")
+    return regressions
+
+
+def git_commit() -> str:
+    """
+    Returns the short hash of the current git commit, with a "+" if there are
+    uncommitted changes, or "nogit" outside of a repository.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        changes = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "nogit"
+    return commit + ("+" if changes else "")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a solver configuration.")
+    parser.add_argument("solver", nargs="?", default="backtrack_solve")
+    parser.add_argument("--params", default="{}", help="e.g. '{\"max_depth\": 2}'")
+    parser.add_argument("--instances", nargs="*", help="e.g. A1 A2 B1")
+    parser.add_argument("--name", help="name of the configuration")
+    parser.add_argument("--baseline", help="run directory to compare with")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("RUN", "BASELINE"), help="only compare runs"
+    )
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_runs(*args.compare)
+    else:
+        run_benchmark(
+            args.solver,
+            json.loads(args.params),
+            args.instances,
+            args.name,
+            baseline=args.baseline,
+        )
@@ -0,0 +1,129 @@
+import argparse
+from random import Random
+from contextlib import contextmanager
+from timeit import timeit
+
+import classes
+from classes import Defect, DefectIndex, Residual
+
+
+def random_residual(n_defects: int, random: Random, indexed: bool = True) -> Residual:
+    """
+    Returns a full plate with n_defects random defects, of the sizes of the
+    defects in the datasets, with the defect index of its bin if indexed is set.
+    """
+    defects = [
+        Defect(
+            i,
+            random.randrange(0, 5900),
+            random.randrange(0, 3110),
+            random.randrange(1, 100),
+            random.randrange(1, 100),
+        )
+        for i in range(n_defects)
+    ]
+    index = DefectIndex.build(defects)
+    return Residual(0, 0, 6000, 3210, index.defects, index if indexed else None)
+
+
+def random_query(random: Random) -> tuple[int, int, int, int]:
+    """
+    Returns the x_low, x_high, y_low, y_high of a random item-sized rectangle.
+    """
+    x, y = random.randrange(0, 5000), random.randrange(0, 3000)
+    return x, x + random.randrange(100, 1500), y, y + random.randrange(100, 1500)
+
+
+@contextmanager
+def always_indexed():
+    """
+    Makes the residuals with a defect index use it at any number of defects.
+    """
+    threshold = classes.MIN_INDEXED_DEFECTS
+    classes.MIN_INDEXED_DEFECTS = 0
+    try:
+        yield
+    finally:
+        classes.MIN_INDEXED_DEFECTS = threshold
+
+
+def check_agreement(n_defects: int, plates: int = 50, queries: int = 100, seed=0):
+    """
+    Checks that the indexed queries of residuals with n_defects defects return
+    the same as the linear scan, on random plates and rectangles.
+
+    Raises:
+        AssertionError: At the first query, where they differ.
+    """
+    random = Random(seed)
+    with always_indexed():
+        _check_agreement(n_defects, plates, queries, random)
+
+
+def _check_agreement(n_defects: int, plates: int, queries: int, random: Random):
+    for _ in range(plates):
+        indexed = random_residual(n_defects, random)
+        # The plate and its sub-residuals keep the defects of the bin in order
+        half = Residual(
+            0, 0, 3000, 3210, indexed.defects_in(0, 3000, 0, 3210), indexed.index
+        )
+        for residual in indexed, half:
+            linear = Residual(0, 0, residual.width, 3210, residual.defects)
+            for _ in range(queries):
+                rectangle = random_query(random)
+                assert residual.has_defect_in(*rectangle) == linear.has_defect_in(
+                    *rectangle
+                ), rectangle
+                assert residual.defects_in(*rectangle) == linear.defects_in(
+                    *rectangle
+                ), rectangle
+                width, length = rectangle[1] - rectangle[0], rectangle[3] - rectangle[2]
+                for is_vertical in True, False:
+                    assert residual.find_place(
+                        width, length, is_vertical
+                    ) == linear.find_place(width, length, is_vertical), rectangle
+
+
+def measure(n_defects: int, queries: int = 200, seed=0) -> tuple[float, float]:
+    """
+    Measures a has_defect_in and a defects_in query of a plate with n_defects
+    defects, with the linear scan and with the index.
+
+    Returns:
+        tuple[float, float]: Nanoseconds of a query, linear and indexed.
+    """
+    random = Random(seed)
+    indexed = random_residual(n_defects, random)
+    linear = Residual(0, 0, 6000, 3210, indexed.defects)
+    rectangles = [random_query(random) for _ in range(queries)]
+
+    def run(residual: Residual):
+        for rectangle in rectangles:
+            residual.has_defect_in(*rectangle)
+            residual.defects_in(*rectangle)
+
+    with always_indexed():
+        return tuple(
+            min(timeit(lambda: run(residual), number=20) for _ in range(3))
+            / (20 * queries)
+            * 1e9
+            for residual in (linear, indexed)
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the defect index against the linear scan."
+    )
+    parser.add_argument(
+        "defects", nargs="*", type=int, default=[1, 4, 8, 12, 16, 24, 32, 64]
+    )
+    args = parser.parse_args()
+
+    print(f"The solvers use the index from {classes.MIN_INDEXED_DEFECTS} defects")
+    print(f"{'Defects':>8}{'Linear ns':>12}{'Indexed ns':>12}")
+    for n_defects in args.defects:
+        check_agreement(n_defects)
+        linear, indexed = measure(n_defects)
+        print(f"{n_defects:>8}{linear:>12.0f}{indexed:>12.0f}")
+    print("The indexed queries agree with the linear scan")
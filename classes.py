@@ -1,7 +1,10 @@
 from dataclasses import dataclass, field
-from typing import Optional, List
+from typing import Optional, List, Callable
 from enum import Enum, auto
-
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+from collections import OrderedDict
+from time import perf_counter
 
 # Global variables
 # Number of available plates (bins) that should not be exceeded
@@ -18,6 +21,10 @@ MAX_1_CUT: int = 3500
 MIN_2_CUT: int = 100
 # Minimum width and height of wastes
 MIN_WASTE: int = 20
+# Below this many defects a residual is scanned linearly instead of with bisect.
+# The scan is faster below it, measured with check_index.py. The bins of the
+# datasets have at most 8 defects, so only denser instances use the index.
+MIN_INDEXED_DEFECTS: int = 16
 
 
 class Place(Enum):
@@ -37,7 +44,42 @@ class Place(Enum):
     UP = auto()
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class GlobalParams:
+    """
+    Class for the global parameters of the problem, as in the checker's
+    global_param.csv. The defaults are the parameters of the challenge.
+
+    Attributes:
+        n_plates (int): Number of available plates (bins).
+        width_plates (int): Width of the plates.
+        height_plates (int): Height of the plates.
+        min_1_cut (int): Minimum distance of consecutive 1-cuts (except wastes).
+        max_1_cut (int): Maximum distance of consecutive 1-cuts (except residual).
+        min_2_cut (int): Minimum distance of consecutive 2-cuts (except wastes).
+        min_waste (int): Minimum width and height of wastes.
+    """
+
+    n_plates: int = N_PLATES
+    width_plates: int = WIDTH_PLATES
+    height_plates: int = HEIGHT_PLATES
+    min_1_cut: int = MIN_1_CUT
+    max_1_cut: int = MAX_1_CUT
+    min_2_cut: int = MIN_2_CUT
+    min_waste: int = MIN_WASTE
+
+    @property
+    def max_waste(self) -> int:
+        """
+        Area of all plates, which is more than the waste of any solution.
+        """
+        return self.n_plates * self.width_plates * self.height_plates
+
+
+DEFAULT_PARAMS = GlobalParams()
+
+
+@dataclass(slots=True)
 class Defect:
     """
     Class for a defect on a bin.
@@ -57,6 +99,67 @@ class Defect:
     height: int
 
 
+@dataclass
+class DefectIndex:
+    """
+    Index of the defects of a bin, shared by all residuals of that bin.
+
+    The defects are sorted by their x coordinate, so the defects that may overlap
+    an x range can be found with bisect. Every residual keeps its defects as a
+    subset of this sorted list, in the same order.
+
+    Attributes:
+        defects (list[Defect]): Defects of the bin sorted by x.
+        max_width (int): Width of the widest defect.
+    """
+
+    defects: list[Defect]
+    max_width: int = 0
+
+    @classmethod
+    def build(cls, defects: list[Defect]) -> "DefectIndex":
+        """
+        Sorts the defects by x, and creates the index from them.
+        """
+        return cls(
+            defects=sorted(defects, key=attrgetter("x")),
+            max_width=max((defect.width for defect in defects), default=0),
+        )
+
+    def between(self, defects: list[Defect], x_low: int, x_high: int) -> list[Defect]:
+        """
+        Returns the defects, from a subset sorted by x, which may overlap the
+        given x range. Every defect overlapping the range is returned, but some
+        of the returned defects may not overlap it.
+        """
+        if x_high < x_low:
+            x_low, x_high = x_high, x_low
+        start = bisect_left(defects, x_low - self.max_width, key=attrgetter("x"))
+        end = bisect_right(defects, x_high, lo=start, key=attrgetter("x"))
+        return defects[start:end]
+
+
+def merge_open_intervals(intervals) -> tuple[list[int], list[int]]:
+    """
+    Merges open intervals, which overlap. Touching intervals are not merged,
+    as their common end point is not inside any of them.
+
+    Returns:
+        tuple[list[int], list[int]]: The sorted starts and ends of the merged intervals.
+    """
+    starts, ends = [], []
+    for start, end in sorted(intervals):
+        # Empty interval
+        if start >= end:
+            continue
+        if ends and start < ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
 @dataclass
 class Bin:
     """
@@ -67,15 +170,17 @@ class Bin:
         width (int): Width of the bin.
         height (int): Height of the bin.
         defects (list[Defect]): List of defects present in the bin.
+        defect_index (DefectIndex): Index of the defects, if defects is sorted by x.
     """
 
     id: int
     width: int
     height: int
     defects: list[Defect]
+    defect_index: Optional[DefectIndex] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Item:
     """
     Class for a item to cut.
@@ -123,7 +228,7 @@ class Batch:
     stacks: list[Stack]
 
 
-@dataclass
+@dataclass(slots=True)
 class Residual:
     """
     Class for a residual glass plate.
@@ -132,6 +237,8 @@ class Residual:
         width (int): Width of the bin.
         height (int): Height of the bin.
         defects (list[Defect]): List of defects present in the bin.
+        index (DefectIndex): Index of the bin's defects. If given, defects
+            must be a subset of index.defects in the same order.
     """
 
     x: int
@@ -139,12 +246,21 @@ class Residual:
     width: int
     height: int
     defects: list[Defect]
+    index: Optional[DefectIndex] = None
+
+    def candidate_defects(self, x_low: int, x_high: int) -> list[Defect]:
+        """
+        Returns the defects that may overlap the given x range.
+        """
+        if self.index is None or len(self.defects) < MIN_INDEXED_DEFECTS:
+            return self.defects
+        return self.index.between(self.defects, x_low, x_high)
 
     def has_defect_in(self, x_low: int, x_high: int, y_low: int, y_high: int) -> bool:
         """
         Returns if there is a defect in a rectangle defined by parameters.
         """
-        for defect in self.defects:
+        for defect in self.candidate_defects(x_low, x_high):
             if (
                 # Has defect between x values
                 (
@@ -178,7 +294,7 @@ class Residual:
             list[Defect]: A list of Defect objects that are within the specified area.
         """
         defects = []
-        for defect in self.defects:
+        for defect in self.candidate_defects(x_low, x_high):
             if (
                 # Has defect between x values
                 (
@@ -196,6 +312,38 @@ class Residual:
                 defects.append(defect)
         return defects
 
+    def next_x_cut(self, x: int) -> int:
+        """
+        Returns the first x coordinate at or after x, where a vertical cut
+        of the residual does not cross a defect.
+        """
+        # Move right until no defect is crossed
+        while True:
+            ends = [
+                defect.x + defect.width
+                for defect in self.defects
+                if defect.x < x < defect.x + defect.width
+            ]
+            if not ends:
+                return x
+            x = max(ends)
+
+    def next_y_cut(self, y: int) -> int:
+        """
+        Returns the first y coordinate at or after y, where a horizontal cut
+        of the residual does not cross a defect.
+        """
+        # Move up until no defect is crossed
+        while True:
+            ends = [
+                defect.y + defect.height
+                for defect in self.defects
+                if defect.y < y < defect.y + defect.height
+            ]
+            if not ends:
+                return y
+            y = max(ends)
+
     def find_place(self, width: int, length: int, is_vertical: bool) -> tuple[int, int]:
         """
         Finds an available position for a rectangle with the specified width and length,
@@ -271,7 +419,36 @@ class Residual:
         return x, y
 
 
-@dataclass
+@dataclass(slots=True)
+class IdCounter:
+    """
+    Counter of the node IDs of a solution.
+
+    Every solve has its own counter, so solves running in the same process
+    or in threads do not change each other's IDs.
+
+    Attributes:
+        next_id (int): ID of the next created node.
+    """
+
+    next_id: int = 0
+
+    def take(self) -> int:
+        """
+        Returns the next ID, and increments the counter.
+        """
+        id = self.next_id
+        self.next_id += 1
+        return id
+
+    def reset(self, value: int = 0):
+        """
+        Continues the IDs from value, e.g. to reuse the IDs of dropped nodes.
+        """
+        self.next_id = value
+
+
+@dataclass(slots=True)
 class Node:
     """
     Class used to produce the output.
@@ -294,6 +471,10 @@ class Node:
         residual (Residual).
         parent Node: Parent node. Root node's parent points to itself.
         children (List[Node]): List of child nodes if it's a branch.
+        ids (IdCounter): Counter of the solve, which gives the IDs of the nodes.
+            Shared by all nodes of the plates of one solution.
+        waste_area (int): Total area of the waste nodes in the tree, kept up
+            to date on the root by mark_waste.
     """
 
     plate_id: int
@@ -318,9 +499,11 @@ class Node:
         type: int,
         cut: int,
         residual: Residual,
+        ids: Optional["IdCounter"] = None,
     ) -> "Node":
         """
         Factory method to create a root node with `parent` set to itself.
+        Its nodes take their IDs from ids, or from a new counter starting at 0.
         """
         root = cls(
             plate_id=plate_id,
@@ -332,13 +515,14 @@ class Node:
             cut=cut,
             residual=residual,
             parent=field(init=False),
+            ids=ids or IdCounter(),
         )
         root.parent = root  # Set parent to self
         return root
 
     def get_root(self):
         node = self
-        while node.parent != node:
+        while node.parent is not node:
             node = node.parent
         return node
 
@@ -348,20 +532,330 @@ class Node:
             node = node.children[-1]
         return node
 
-    # Class-level attribute to automatically assign IDs
-    _id_counter: int = field(init=False, repr=False, default=0)
+    def mark_waste(self):
+        """
+        Marks the node as waste, and adds its area to the waste area of the root.
+        """
+        if self.type != -1:
+            self.type = -1
+            self.get_root().waste_area += self.width * self.height
+
+    ids: Optional["IdCounter"] = field(default=None, repr=False, compare=False)
     id: int = field(init=False)
+    waste_area: int = field(init=False, repr=False, default=0)
 
     def __post_init__(self):
-        # Automatically assign and increment the ID
-        self.id = Node._id_counter
-        Node._id_counter += 1
-
         # Set parent to self for the root node (when no parent is provided)
         if not hasattr(self, "parent"):
             self.parent = self
 
-    @classmethod
-    def reset_id_counter(cls, value: int = 0):
-        """Reset the class-level ID counter to 0."""
-        cls._id_counter = value
+        # Take the next ID from the counter of the tree
+        if self.ids is None:
+            self.ids = self.parent.ids if self.parent is not self else IdCounter()
+        self.id = self.ids.take()
+
+
+@dataclass
+class BeamState:
+    """
+    Class for a partial solution in the beam search.
+
+    Attributes:
+        trees (list[Node]): Root nodes of the used plates, only the last one is open.
+        current_node (Node): Node of the open plate to continue the placement from.
+        positions (tuple[int, ...]): Index of the next item to cut in each stack.
+        next_bin (int): Index of the next unused bin.
+        score (int): Waste area of the plates plus the open residual area.
+    """
+
+    trees: list[Node]
+    current_node: Node
+    positions: tuple[int, ...]
+    next_bin: int
+    score: int = 0
+
+
+@dataclass
+class TranspositionTable:
+    """
+    Bounded memo table for the backtrack search.
+    If it is full, the least recently used state is evicted.
+
+    Attributes:
+        max_size (int): Maximum number of stored states.
+        entries (OrderedDict): Stored values by state key, the most recently used last.
+        hits (int): Number of lookups that found a stored state.
+        misses (int): Number of lookups that did not.
+    """
+
+    max_size: int = 100000
+    entries: OrderedDict = field(default_factory=OrderedDict)
+    hits: int = 0
+    misses: int = 0
+
+    def get(self, key: tuple):
+        """
+        Returns the value stored for the key, or None if there is none.
+        """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value):
+        """
+        Stores the value for the key, and evicts the least recently used state if needed.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+@dataclass
+class SearchBound:
+    """
+    Shared state and settings of the levels of one backtrack search.
+
+    Attributes:
+        best_waste (int): Smallest waste of a searched branch so far.
+        prune (bool): Whether to skip the branches which cannot be better.
+        pruned (int): Number of branches skipped.
+        move_order (Callable | None): Orders the moves (stack index and rotation)
+            of a state, given the stacks and the current node. None for the
+            order of the stacks, original orientation first.
+        hint (list[Item]): Items expected to be the best, their moves are tried first.
+        max_nodes (int | None): Number of expanded states to stop the search after.
+        stop_time (float | None): perf_counter time to stop the search after.
+        nodes (int): Number of expanded states.
+        stopped (bool): Whether the search was stopped by max_nodes or stop_time.
+    """
+
+    best_waste: int
+    prune: bool = False
+    pruned: int = 0
+    move_order: Optional[Callable] = None
+    hint: list[Item] = field(default_factory=list)
+    max_nodes: Optional[int] = None
+    stop_time: Optional[float] = None
+    nodes: int = 0
+    stopped: bool = False
+
+    def exhausted(self) -> bool:
+        """
+        Returns whether the search used up max_nodes or passed stop_time.
+        """
+        if not self.stopped:
+            self.stopped = (
+                self.max_nodes is not None and self.nodes >= self.max_nodes
+            ) or (self.stop_time is not None and perf_counter() > self.stop_time)
+        return self.stopped
+
+
+@dataclass(slots=True)
+class SolutionRow:
+    """
+    Class for a node of a solution, as it is in the solution file.
+
+    Attributes:
+        plate_id (int): Identifier of the plate.
+        node_id (int): Identifier of the node, which is also its row index.
+        x (int): X coordinate of the bottom left corner of the node.
+        y (int): Y coordinate of the bottom left corner of the node.
+        width (int): Width of the node.
+        height (int): Height of the node.
+        type (int): Item ID, or -1 for waste, -2 for branch, -3 for residual.
+        cut (int): Cut level of the node.
+        parent (int | None): Identifier of the parent, None for a plate.
+        children (list[SolutionRow]): Child nodes in the order of the file.
+    """
+
+    plate_id: int
+    node_id: int
+    x: int
+    y: int
+    width: int
+    height: int
+    type: int
+    cut: int
+    parent: Optional[int] = None
+    children: list["SolutionRow"] = field(default_factory=list)
+
+
+@dataclass
+class Validation:
+    """
+    Class for the result of validating a solution.
+
+    Attributes:
+        errors (list[str]): Violated constraints, empty for a valid solution.
+        plates (int): Number of used plates.
+        residual_width (int): Width of the residual of the last plate.
+        objective (int): Objective function value of the checker, the used area
+            without the residual, minus the area of the items.
+    """
+
+    errors: list[str] = field(default_factory=list)
+    plates: int = 0
+    residual_width: int = 0
+    objective: int = 0
+
+    @property
+    def valid(self) -> bool:
+        return not self.errors
+
+
+@dataclass
+class InstanceBounds:
+    """
+    Class for the lower bounds of an instance, from the areas of its items
+    and of its bins without the defects.
+
+    Attributes:
+        items (int): Number of items.
+        item_area (int): Total area of the items.
+        defect_area (int): Area of the defects of the first min_plates bins.
+        min_plates (int): Minimum number of plates, as the items fit into
+            the defect-free area of the first min_plates bins at the earliest.
+        waste (int): Lower bound of the objective function of any solution.
+    """
+
+    items: int
+    item_area: int
+    defect_area: int
+    min_plates: int
+    waste: int
+
+
+@dataclass
+class CallStats:
+    """
+    Class for the measurements of an instrumented function.
+
+    Attributes:
+        calls (int): Number of calls, including the recursive ones.
+        time (float): Time spent in the outermost calls, in seconds.
+        depth (int): Number of the currently running calls.
+    """
+
+    calls: int = 0
+    time: float = 0.0
+    depth: int = 0
+
+
+@dataclass(slots=True)
+class SolveEvent:
+    """
+    Class for a progress or metrics report of a solve.
+
+    Attributes:
+        kind (str): "start", "progress", "finish" or "message".
+        id (str): Instance ID.
+        elapsed (float): Seconds since the start of the solve.
+        message (str): Text of the event, for a log.
+        placed (int): Number of placed items, in "progress".
+        total (int): Number of items of the instance, in "progress".
+        plates (int): Number of used plates, in "progress" and "finish".
+        waste (int): Waste area of the used plates, in "progress" and "finish".
+        nodes (int): Number of expanded search states so far.
+        lower_bound (int | None): Lower bound of the waste, if the context
+            has the bounds of the instance.
+    """
+
+    kind: str
+    id: str
+    elapsed: float
+    message: str = ""
+    placed: int = 0
+    total: int = 0
+    plates: int = 0
+    waste: int = 0
+    nodes: int = 0
+    lower_bound: Optional[int] = None
+
+
+@dataclass
+class SolverContext:
+    """
+    Class for everything a solve uses besides its arguments: the instance,
+    the global parameters, the output and the statistics.
+    Solves with different contexts can run side by side in one process.
+
+    Attributes:
+        id (str): Instance ID (e.g., "A1").
+        bins (list[Bin]): Bins of the instance, never changed by the solvers.
+        batch (Batch): Stacks of the instance, never changed by the solvers.
+        params (GlobalParams): Global parameters of the problem.
+        events (Callable[[SolveEvent], None] | None): Receives the events of the
+            solves, e.g. a sink of progress.py. None to send nothing.
+        progress_interval (float): Minimum seconds between two "progress" events.
+        expanded_nodes (int): Number of search states expanded by the solves.
+        bounds (InstanceBounds | None): Lower bounds of the instance, to report
+            the gap of the solutions, and to stop when a solution reaches them.
+    """
+
+    id: str
+    bins: list[Bin]
+    batch: Batch
+    params: GlobalParams = DEFAULT_PARAMS
+    events: Optional[Callable[[SolveEvent], None]] = None
+    progress_interval: float = 0.5
+    expanded_nodes: int = 0
+    bounds: Optional[InstanceBounds] = None
+    start_time: float = field(init=False, default=0.0, repr=False)
+    next_progress: float = field(init=False, default=0.0, repr=False)
+
+    def instance(self) -> tuple[list[Bin], Batch]:
+        """
+        Returns new lists of the bins and the stacks, which a solve can use up,
+        so the instance is read only once for all solves of the context.
+        The bins and the items themselves are shared, as they are not changed.
+        """
+        stacks = [Stack(stack.id, list(stack.sequence)) for stack in self.batch.stacks]
+        return list(self.bins), Batch(stacks)
+
+    def report(
+        self,
+        kind: str,
+        message: str = "",
+        trees: Optional[list[Node]] = None,
+        placed: int = 0,
+        total: int = 0,
+    ):
+        """
+        Sends an event to events, if it is set, with the number of plates
+        and their waste, if trees is given. A "start" event restarts the clock.
+        """
+        if self.events is None:
+            return
+        now = perf_counter()
+        if kind == "start":
+            self.start_time = now
+        self.events(
+            SolveEvent(
+                kind,
+                self.id,
+                now - self.start_time,
+                message,
+                placed,
+                total,
+                plates=len(trees) if trees else 0,
+                waste=sum(tree.waste_area for tree in trees) if trees else 0,
+                nodes=self.expanded_nodes,
+                lower_bound=self.bounds.waste if self.bounds is not None else None,
+            )
+        )
+
+    def report_progress(self, placed: int, total: int, trees: list[Node]):
+        """
+        Sends a "progress" event, at most once in progress_interval seconds,
+        but always for the last item.
+        """
+        now = perf_counter()
+        if now < self.next_progress and placed < total:
+            return
+        self.next_progress = now + self.progress_interval
+        self.report("progress", trees=trees, placed=placed, total=total)
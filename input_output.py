@@ -1,18 +1,46 @@
 import os
-import pandas as pd
+import io
 import sys
 import csv
-from typing import Optional, List
-from classes import Bin, Batch, Item, Stack, Defect, Node, WIDTH_PLATES, HEIGHT_PLATES
-
-
-def read_instance(id: str = "A1") -> tuple[list[Bin], Batch]:
+import pickle
+import hashlib
+import zipfile
+from typing import Optional, List, Iterable
+from classes import (
+    Bin,
+    Batch,
+    Item,
+    Stack,
+    Defect,
+    DefectIndex,
+    Node,
+    SolutionRow,
+    GlobalParams,
+    DEFAULT_PARAMS,
+)
+
+
+def read_instance(
+    id: str = "A1",
+    base_path: str = "datasets",
+    cache_dir: Optional[str] = None,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> tuple[list[Bin], Batch]:
     """
     Loads a dataset instance based on the given ID, returning Bin and Batch data.
 
+    The files are read from the unpacked dataset directory if it exists,
+    otherwise directly from the dataset's zip archive.
+
     Parameters:
         id (str): Dataset instance ID (e.g., "A1"), where the first character
                   indicates the dataset. Defaults to "A1".
+        base_path (str): Path to the main datasets folder.
+        cache_dir (str): If given, the parsed instance is pickled into this
+                  directory, and loaded from there on the next runs, while
+                  it is newer than the files of the instance.
+        params (GlobalParams): Global parameters, which give the number and
+                  the size of the bins.
 
     Returns:
         tuple[list[Bin], Batch]: A tuple with:
@@ -21,9 +49,6 @@ def read_instance(id: str = "A1") -> tuple[list[Bin], Batch]:
     """
     dataset = id[0]
 
-    # Path to the main datasets folder
-    base_path = "datasets"
-
     # Directory of the dataset
     dataset_path = f"dataset_{dataset}"
 
@@ -31,13 +56,45 @@ def read_instance(id: str = "A1") -> tuple[list[Bin], Batch]:
     batch_file = f"{id}_batch.csv"
     defects_file = f"{id}_defects.csv"
 
-    # Read batches
+    unpacked = os.path.isdir(os.path.join(base_path, dataset_path))
     batch_file_path = os.path.join(base_path, dataset_path, batch_file)
-    batch = read_batch(batch_file_path)
-
-    # Read defects
     defects_file_path = os.path.join(base_path, dataset_path, defects_file)
-    bins = read_defects(defects_file_path)
+    zip_path = os.path.join(base_path, f"{dataset_path}.zip")
+
+    if cache_dir is not None:
+        # The bins depend on the parameters too, and the datasets folder
+        # is part of the name, as other folders may have other instances
+        folder = hashlib.sha1(os.path.abspath(base_path).encode()).hexdigest()[:8]
+        name = f"{id}_{folder}"
+        if params != DEFAULT_PARAMS:
+            name += f"_{params.n_plates}_{params.width_plates}_{params.height_plates}"
+        cache_path = os.path.join(cache_dir, f"{name}.pickle")
+        # The cache is stale, if the files were changed after it was written
+        sources = [batch_file_path, defects_file_path] if unpacked else [zip_path]
+        if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= max(
+            os.path.getmtime(source) for source in sources
+        ):
+            with open(cache_path, "rb") as file:
+                return pickle.load(file)
+
+    if unpacked:
+        # Read batches
+        batch = read_batch(batch_file_path)
+
+        # Read defects
+        bins = read_defects(defects_file_path, params)
+    else:
+        # Read both from the zip archive of the dataset
+        with zipfile.ZipFile(zip_path) as archive:
+            with archive.open(f"{dataset_path}/{batch_file}") as file:
+                batch = parse_batch(io.TextIOWrapper(file, newline=""))
+            with archive.open(f"{dataset_path}/{defects_file}") as file:
+                bins = parse_defects(io.TextIOWrapper(file, newline=""), params)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, "wb") as file:
+            pickle.dump((bins, batch), file)
 
     # returns the dataset
     return bins, batch
@@ -48,21 +105,34 @@ def read_batch(file_path: str) -> Batch:
     Generated by ChatGPT
     Read batches.csv and retuns a batch
     """
-    # Read the CSV file
-    df = pd.read_csv(file_path, sep=";")
+    with open(file_path, newline="") as file:
+        return parse_batch(file)
+
+
+def parse_batch(file: Iterable[str]) -> Batch:
+    """
+    Parses the lines of a batches.csv and retuns a batch
+    """
+    rows = csv.reader(file, delimiter=";")
+    header = next(rows)
+    item_col = header.index("ITEM_ID")
+    width_col = header.index("WIDTH_ITEM")
+    length_col = header.index("LENGTH_ITEM")
+    stack_col = header.index("STACK")
 
     # Create a dictionary to group items by stack
     stacks_dict = {}
 
-    # Iterate over each row in the dataframe
-    for _, row in df.iterrows():
+    for row in rows:
         # Create an Item object for each row
         item = Item(
-            id=row["ITEM_ID"], width=row["WIDTH_ITEM"], length=row["LENGTH_ITEM"]
+            id=int(row[item_col]),
+            width=int(row[width_col]),
+            length=int(row[length_col]),
         )
 
         # Add the item to the correct stack
-        stack_id = row["STACK"]
+        stack_id = int(row[stack_col])
 
         if stack_id not in stacks_dict:
             stacks_dict[stack_id] = []
@@ -82,30 +152,46 @@ def read_batch(file_path: str) -> Batch:
     return batch
 
 
-def read_defects(file_path: str) -> list[Bin]:
+def read_defects(file_path: str, params: GlobalParams = DEFAULT_PARAMS) -> list[Bin]:
     """
     Generated by ChatGPT
     Read defects.csv and returns a tuple of bins
     """
-    # Read the CSV file
-    df = pd.read_csv(file_path, sep=";")
+    with open(file_path, newline="") as file:
+        return parse_defects(file, params)
+
+
+def parse_defects(
+    file: Iterable[str], params: GlobalParams = DEFAULT_PARAMS
+) -> list[Bin]:
+    """
+    Parses the lines of a defects.csv and returns a tuple of bins,
+    at least params.n_plates of them, with the size of the plates of params.
+    """
+    rows = csv.reader(file, delimiter=";")
+    header = next(rows)
+    id_col = header.index("DEFECT_ID")
+    plate_col = header.index("PLATE_ID")
+    x_col = header.index("X")
+    y_col = header.index("Y")
+    width_col = header.index("WIDTH")
+    height_col = header.index("HEIGHT")
 
     # Dictionary to group defects by Bin (plate)
-    bins_dict = {key: [] for key in range(100)}
+    bins_dict = {key: [] for key in range(params.n_plates)}
 
-    # Iterate over each row in the dataframe
-    for _, row in df.iterrows():
+    for row in rows:
         # Create a Defect object for each row
         defect = Defect(
-            id=int(row["DEFECT_ID"]),
-            x=int(float(row["X"])),
-            y=int(float(row["Y"])),
-            width=int(float(row["WIDTH"])),
-            height=int(float(row["HEIGHT"])),
+            id=int(row[id_col]),
+            x=int(float(row[x_col])),
+            y=int(float(row[y_col])),
+            width=int(float(row[width_col])),
+            height=int(float(row[height_col])),
         )
 
         # Get the bin (plate) ID
-        bin_id = int(row["PLATE_ID"])
+        bin_id = int(row[plate_col])
 
         # Group defects by bin (plate)
         if bin_id not in bins_dict:
@@ -113,69 +199,182 @@ def read_defects(file_path: str) -> list[Bin]:
 
         bins_dict[bin_id].append(defect)
 
-    # Create Bin objects from the grouped defects
-    bins = [
-        Bin(id=bin_id, width=WIDTH_PLATES, height=HEIGHT_PLATES, defects=defects)
-        for bin_id, defects in bins_dict.items()
-    ]
+    # Create Bin objects from the grouped defects, with their defects sorted by x
+    bins = []
+    for bin_id, defects in bins_dict.items():
+        defect_index = DefectIndex.build(defects)
+        bins.append(
+            Bin(
+                id=bin_id,
+                width=params.width_plates,
+                height=params.height_plates,
+                defects=defect_index.defects,
+                defect_index=defect_index,
+            )
+        )
 
     # Now 'bins' contains a list of Bin objects with associated defects
     return bins
 
 
+def read_global_params(file_path: str) -> GlobalParams:
+    """
+    Reads global_param.csv of the checker, and returns its parameters.
+    """
+    with open(file_path, newline="") as file:
+        return parse_global_params(file)
+
+
+def parse_global_params(file: Iterable[str]) -> GlobalParams:
+    """
+    Parses the lines of a global_param.csv, the missing parameters are the defaults.
+    """
+    # Names of the parameters in the file
+    names = {
+        "nPlates": "n_plates",
+        "widthPlates": "width_plates",
+        "heightPlates": "height_plates",
+        "min1Cut": "min_1_cut",
+        "max1Cut": "max_1_cut",
+        "min2Cut": "min_2_cut",
+        "minWaste": "min_waste",
+    }
+
+    rows = csv.reader(file, delimiter=";")
+    header = next(rows)
+    name_col = header.index("NAME")
+    value_col = header.index("VALUE")
+
+    values = {}
+    for row in rows:
+        if row and row[name_col] in names:
+            values[names[row[name_col]]] = int(row[value_col])
+
+    return GlobalParams(**values)
+
+
+class SolutionWriter:
+    """
+    Writes solution trees into a solution file, one plate at a time,
+    so a plate can be written as soon as it is finished.
+
+    Usage:
+        with SolutionWriter(output_path) as writer:
+            writer.write_tree(root)
+    """
+
+    HEADER = [
+        "PLATE_ID",
+        "NODE_ID",
+        "X",
+        "Y",
+        "WIDTH",
+        "HEIGHT",
+        "TYPE",
+        "CUT",
+        "PARENT",
+    ]
+
+    def __init__(self, output_path: str):
+        self.file = open(output_path, mode="w", newline="")
+        self.writer = csv.writer(self.file, delimiter=";", lineterminator=os.linesep)
+        self.writer.writerow(self.HEADER)
+
+    def write_tree(self, root: Node):
+        """
+        Writes the nodes of a tree in depth-first order.
+        The root has an empty parent.
+        """
+        for row in tree_rows(root):
+            self.writer.writerow(
+                (
+                    row.plate_id,
+                    row.node_id,
+                    row.x,
+                    row.y,
+                    row.width,
+                    row.height,
+                    row.type,
+                    row.cut,
+                    "" if row.parent is None else row.parent,
+                )
+            )
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> "SolutionWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def tree_rows(root: Node) -> Iterable[SolutionRow]:
+    """
+    Yields the nodes of a tree as solution rows in depth-first order,
+    without recursion. The root has no parent.
+    """
+    nodes = [(root, None)]
+    while nodes:
+        node, parent_id = nodes.pop()
+        yield SolutionRow(
+            node.plate_id,
+            node.id,
+            node.x,
+            node.y,
+            node.width,
+            node.height,
+            node.type,
+            node.cut,
+            parent_id,
+        )
+        # Push the children in reverse, so they are yielded in order
+        nodes.extend((child, node.id) for child in reversed(node.children))
+
+
+def read_solution(path: str) -> list[SolutionRow]:
+    """
+    Reads the rows of a solution file.
+
+    Parameters:
+        path (str): Path of the solution file.
+
+    Returns:
+        list[SolutionRow]: The rows in the order of the file, without children.
+    """
+    with open(path, newline="") as file:
+        reader = csv.reader(file, delimiter=";")
+        header = next(reader)
+        columns = [header.index(name) for name in SolutionWriter.HEADER]
+
+        rows = []
+        for line in reader:
+            if not line:
+                continue
+            values = [line[column] for column in columns]
+            parent = values.pop()
+            rows.append(
+                SolutionRow(*map(int, values), parent=int(parent) if parent else None)
+            )
+    return rows
+
+
 def convert_to_solution_file(
     trees: List[Node],
     id="A1",
-    output_path=os.path.join("solutions", f"{id}_solution.csv"),
+    output_path: Optional[str] = None,
 ):
     """
     Convert a solution of trees into the solution file format.
     Credit: ChatGPT
     """
+    if output_path is None:
+        output_path = os.path.join("solutions", f"{id}_solution.csv")
 
-    def traverse_tree(root: Node):
-        # Store the result in a list of dictionaries
-        result = []
-
-        def traverse(node: Node, parent_id: Optional[int]):
-            # Collect node attributes into a dictionary
-            data = {
-                "PLATE_ID": node.plate_id,
-                "NODE_ID": node.id,
-                "X": node.x,
-                "Y": node.y,
-                "WIDTH": node.width,
-                "HEIGHT": node.height,
-                "TYPE": node.type,
-                "CUT": node.cut,
-                "PARENT": parent_id,
-            }
-            # Append the data to the result list
-            result.append(data)
-
-            # Recursively traverse children
-            for child in node.children:
-                traverse(child, node.id)
-
-        # Start traversal with root node
-        traverse(root, None)
-
-        return result
-
-    # Collecting data from all root nodes
-    all_nodes_data = []
-    for root in trees:
-        all_nodes_data.extend(traverse_tree(root))
-
-    # Convert collected data to DataFrame
-    df = pd.DataFrame(all_nodes_data)
-
-    # Convert 'PARENT' column to nullable integer type to handle None values without converting to float
-    # 'Int64' with a capital 'I' is a nullable integer type
-    df["PARENT"] = df["PARENT"].astype("Int64")
-
-    # save to CSV
-    df.to_csv(output_path, sep=";", index=False)
+    with SolutionWriter(output_path) as writer:
+        for root in trees:
+            writer.write_tree(root)
 
 
 def draw_loading_bar(total, current, length=50, fill="█"):
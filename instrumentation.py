@@ -0,0 +1,101 @@
+from functools import wraps
+from time import perf_counter
+
+import solve
+from classes import Residual, CallStats
+
+# Instrumented functions, by the module or class they are looked up from
+HOT_PATHS = [
+    (solve, "place_item"),
+    (solve, "place_1_cut"),
+    (solve, "place_2_cut"),
+    (solve, "place_3_cut"),
+    (solve, "place_4_cut"),
+    (Residual, "find_place"),
+    (Residual, "defects_in"),
+    (solve, "deepcopy"),
+    (solve, "sum_waste_area"),
+    (solve, "backtrack"),
+]
+
+stats: dict[str, CallStats] = {}
+originals: dict[str, tuple] = {}
+
+
+def enable():
+    """
+    Starts counting and timing the calls of the HOT_PATHS, with zeroed stats.
+
+    The functions are replaced by measuring wrappers until disable is called,
+    so nothing is measured, and nothing slows down while it is off.
+    Only the calls of this process are measured, not of the worker processes.
+    """
+    reset()
+    for owner, name in HOT_PATHS:
+        key = f"{owner.__name__}.{name}"
+        if key in originals:
+            continue
+        function = getattr(owner, name)
+        originals[key] = (owner, name, function)
+        setattr(owner, name, measured(function, stats.setdefault(key, CallStats())))
+
+
+def disable():
+    """
+    Puts back the original functions. The stats are kept until the next enable.
+    """
+    for owner, name, function in originals.values():
+        setattr(owner, name, function)
+    originals.clear()
+
+
+def reset():
+    """
+    Zeroes the stats of every hot path.
+    """
+    for call_stats in stats.values():
+        call_stats.calls = 0
+        call_stats.time = 0.0
+
+
+def measured(function, call_stats: CallStats):
+    """
+    Wraps a function to count its calls in call_stats, and time them.
+    Recursive calls are counted, but only the outermost call is timed,
+    so the time is not counted multiple times.
+    """
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        call_stats.calls += 1
+        if call_stats.depth:
+            call_stats.depth += 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                call_stats.depth -= 1
+
+        call_stats.depth = 1
+        start_time = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            call_stats.time += perf_counter() - start_time
+            call_stats.depth = 0
+
+    return wrapper
+
+
+def print_report(total_time: float | None = None):
+    """
+    Prints the calls and times of the hot paths, and their share of total_time
+    (seconds), if given.
+    """
+    print(f"\t{'function':<28}{'calls':>12}{'time (s)':>12}{'per call (us)':>16}")
+    for key, call_stats in stats.items():
+        per_call = call_stats.time / call_stats.calls * 1e6 if call_stats.calls else 0
+        share = f"{100 * call_stats.time / total_time:>8.1f}%" if total_time else ""
+        print(
+            f"\t{key:<28}{call_stats.calls:>12}{call_stats.time:>12.3f}"
+            f"{per_call:>16.2f}{share}"
+        )
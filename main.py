@@ -1,36 +1,104 @@
 import os
+import cProfile
+import instrumentation
 from solve import (
     first_fit_solve,
     first_fit_with_rotate,
     backtrack_solve,
+    local_search,
+    solver_context,
     waste_proportion,
 )
-from classes import Node
+from progress import console
 from input_output import convert_to_solution_file, write_to_csv
+from validate import validate_solution
 from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 solve = backtrack_solve
 results = []
 
 
-def run_all(output_path="solutions"):
-    run_dataset("A", output_path)
-    run_dataset("B", output_path)
-    run_dataset("X", output_path)
+def run_all(output_path="solutions", workers=1):
+    run_dataset("A", output_path, workers)
+    run_dataset("B", output_path, workers)
+    run_dataset("X", output_path, workers)
 
 
-def run_dataset(dataset="A", output_path="solutions"):
-    limit = 21 if dataset == "A" else 16
-    for i in range(1, limit):
-        Node.reset_id_counter()
-        param = f"{dataset}{i}"
+def run_dataset(dataset="A", output_path="solutions", workers=1, threads=False):
+    if workers > 1:
+        results.extend(
+            run_parallel(
+                dataset_instances(dataset), output_path, workers, threads=threads
+            )
+        )
+        return
+
+    for param in dataset_instances(dataset):
         run_one(param, output_path)
 
 
-def run_one(param="A1", output_path="solutions"):
+def dataset_instances(dataset="A") -> list[str]:
+    """
+    Returns the instance IDs of a dataset, e.g. A1, ..., A20.
+    """
+    limit = 21 if dataset == "A" else 16
+    return [f"{dataset}{i}" for i in range(1, limit)]
+
+
+def run_one(param="A1", output_path="solutions", stats=False, profile_dir=None):
+    """
+    Solves an instance, and appends its row to results.
+
+    If stats is set, the hot paths of the solver are counted and timed
+    with instrumentation, and printed.
+    If profile_dir is given, the solve is profiled with cProfile, and its stats
+    are written into profile_dir as <param>.prof, to be read with pstats.
+    """
+    profiler = cProfile.Profile() if profile_dir is not None else None
+    if stats:
+        instrumentation.enable()
+    if profiler is not None:
+        profiler.enable()
+
+    start_time = perf_counter()
+    try:
+        results.append(solve_instance(param, output_path))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_dir, f"{param}.prof"))
+        if stats:
+            instrumentation.disable()
+            instrumentation.print_report(perf_counter() - start_time)
+
+
+def solve_instance(
+    param="A1",
+    output_path="solutions",
+    validate=True,
+    events=console,
+    improve_time=0.0,
+) -> tuple[str, float, float]:
+    """
+    Solves an instance, writes its solution file into output_path,
+    and returns its (id, runtime, waste) row.
+    If validate is set, the solution is checked with validate_solution,
+    and the violated constraints are printed.
+    The events of the solver are sent to events, None to send them nowhere.
+    If improve_time is positive, the solution is improved with local_search
+    for this many seconds.
+    """
     output_path = os.path.join(output_path, f"{param}_solution.csv")
     start_time = perf_counter()
-    solution_trees = solve(param, 1)
+    context = solver_context(param)
+    context.events = events
+    solution_trees = solve(param, 1, context=context)
+    if improve_time > 0:
+        solution_trees = local_search(
+            solution_trees, time_limit=improve_time, context=context
+        )
 
     convert_to_solution_file(solution_trees, param, output_path)
     end_time = perf_counter()
@@ -38,13 +106,59 @@ def run_one(param="A1", output_path="solutions"):
     print(f"\truntime: {runtime:.2f} seconds")
     waste = waste_proportion(solution_trees)
     print(f"waste: {waste}%")
-    results.append((param, round(runtime, 2), waste))
+
+    if validate:
+        validation = validate_solution(solution_trees, param)
+        if validation.valid:
+            print(f"\tvalid, objective: {validation.objective}")
+        else:
+            print(f"\tINVALID solution of {param}:")
+            for error in validation.errors:
+                print(f"\t\t{error}")
+
+    return (param, round(runtime, 2), waste)
+
+
+def run_parallel(
+    params: list[str],
+    output_path="solutions",
+    workers: int | None = None,
+    results_file: str | None = None,
+    threads: bool = False,
+) -> list[tuple[str, float, float]]:
+    """
+    Solves the instances in parallel worker processes, or in threads if threads
+    is set. The threads only run in parallel on a free-threaded Python build.
+    The solvers send no events, only the finished instances are printed.
+
+    Each solution file is written by its worker as soon as it is solved.
+    The (id, runtime, waste) rows are returned in the order of params,
+    and written to results_file in the format of write_to_csv, if given.
+    """
+    rows = {}
+    pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    with pool(max_workers=workers) as executor:
+        futures = [
+            executor.submit(solve_instance, param, output_path, events=None)
+            for param in params
+        ]
+        for future in as_completed(futures):
+            row = future.result()
+            rows[row[0]] = row
+            print(f"Solved {row[0]} ({len(rows)}/{len(params)})")
+
+    data = [rows[param] for param in params]
+    if results_file is not None:
+        write_to_csv(results_file, data)
+    return data
 
 
 if __name__ == "__main__":
     # output_path = os.path.join("checker", "checker", "instances_checker")
     output_path = os.path.join("solutions", "backtrack_1")
     # run_one("A5")
+    # run_one("A5", stats=True, profile_dir="profiles")
     run_dataset("A", output_path)
     # run_all()
+    # run_parallel(dataset_instances("A"), output_path, results_file="backtrack_1.csv")
     # write_to_csv(f"backtrack_1.csv", results)
@@ -0,0 +1,74 @@
+import json
+import threading
+from dataclasses import asdict
+from typing import Callable, TextIO
+
+from classes import SolveEvent
+from analyze import gap
+from input_output import draw_loading_bar
+
+
+def console(event: SolveEvent):
+    """
+    Prints the messages of the events, and draws a loading bar of the progress.
+    A finished solve is printed with its gap to the lower bound, if it is known.
+    """
+    if event.kind == "progress":
+        draw_loading_bar(event.total, event.placed)
+    elif event.message:
+        print(event.message)
+        if event.kind == "finish" and event.lower_bound is not None:
+            print(
+                f"\twaste {event.waste}, lower bound {event.lower_bound}, "
+                f"gap {gap(event.waste, event.lower_bound)}%"
+            )
+
+
+class Collector:
+    """
+    Keeps the events in memory, e.g. to compare the progress of configurations.
+
+    Attributes:
+        events (list[SolveEvent]): The received events, in order.
+    """
+
+    def __init__(self):
+        self.events: list[SolveEvent] = []
+
+    def __call__(self, event: SolveEvent):
+        self.events.append(event)
+
+    def of_kind(self, kind: str) -> list[SolveEvent]:
+        """
+        Returns the received events of a kind, e.g. "finish".
+        """
+        return [event for event in self.events if event.kind == kind]
+
+
+class JsonLinesLog:
+    """
+    Writes every event as a line of JSON into a file, for a structured log
+    of many solves. Solves in threads can share it.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+        self.lock = threading.Lock()
+
+    def __call__(self, event: SolveEvent):
+        line = json.dumps(asdict(event))
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+
+def tee(*sinks: Callable[[SolveEvent], None]) -> Callable[[SolveEvent], None]:
+    """
+    Returns a sink, which sends every event to all of the sinks.
+    """
+
+    def send(event: SolveEvent):
+        for sink in sinks:
+            sink(event)
+
+    return send
@@ -1,125 +1,334 @@
-from input_output import read_instance, convert_to_solution_file, draw_loading_bar
+from input_output import (
+    read_instance,
+    convert_to_solution_file,
+    tree_rows,
+    SolutionWriter,
+)
 from classes import (
     Bin,
     Item,
+    Batch,
     Stack,
     Node,
+    IdCounter,
     Residual,
     Place,
-    MIN_1_CUT,
-    MIN_2_CUT,
-    MIN_WASTE,
-    WIDTH_PLATES,
-    HEIGHT_PLATES,
+    TranspositionTable,
+    BeamState,
+    SearchBound,
+    GlobalParams,
+    SolverContext,
+    DEFAULT_PARAMS,
 )
-from typing import List, Tuple
+from typing import List, Tuple, Callable
 from copy import deepcopy, copy
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pprint import pprint
+from progress import console
+from analyze import analyze_instance
 from math import log
-
+from random import Random
+from time import perf_counter
 
 # TODO max distance between 1-cuts: 3500 (except residual)
 # TODO must contain at least one 1-cut
 
 # TODO merge place_4_cut and trim
-MAX_WASTE = WIDTH_PLATES * HEIGHT_PLATES * 100
-to_log = True
 
 
 def backtrack_solve(
-    id: str = "A1", max_depth: int = 1, extended_waste_calculation=False, cut_all=True
+    id: str = "A1",
+    max_depth: int = 1,
+    extended_waste_calculation=False,
+    cut_all=True,
+    use_undo_log=True,
+    memo_size: int = 0,
+    workers: int = 1,
+    deadline: float | None = None,
+    writer: SolutionWriter | None = None,
+    prune: bool = False,
+    move_order: Callable | None = None,
+    max_nodes: int | None = None,
+    lookahead_time: float | None = None,
+    threads: bool = False,
+    context: SolverContext | None = None,
 ):
-    print(f"Started backtrack solve algorithm for {id}")
+    """
+    Solves the glass-cutting problem with a depth-limited backtrack lookahead.
+
+    If use_undo_log is set, the lookahead places the items on the current tree
+    and reverts them with an undo log, instead of deep copying the tree
+    for every branch.
+    If memo_size is positive, the results of the searched states are stored in
+    a transposition table of this size, shared by every lookahead of the solve.
+    If workers is more than 1, the first level branches of every lookahead are
+    searched in a process pool of this size, with the same decisions as serial.
+    If threads is also set, it is a thread pool, whose tasks share the bin data
+    instead of pickling it. These only run in parallel on a free-threaded build.
+    If deadline (a perf_counter time) is given, raises TimeoutError when it is
+    passed before the solve is finished.
+    If writer is given, every plate is written with it as soon as it is finished.
+    If prune is set, the lookahead skips the branches which cannot be better than
+    the best one found, and the number of skipped branches is printed.
+    move_order (e.g. largest_area_first or exact_fit_first) orders the branches
+    of the lookahead, and the not yet cut items of the previous lookahead's best
+    branch are tried first. If max_nodes or lookahead_time (seconds) is given,
+    a lookahead is stopped after expanding that many states or after that time,
+    with its best branch found so far.
+    If context is given, its instance is solved with its parameters and sinks,
+    instead of reading the instance of id.
+    """
+    context = solver_context(id, context)
+    params = context.params
+    context.report("start", f"Started backtrack solve algorithm for {context.id}")
     # trees containts the root nodes of the output
     trees: list[Node] = []
 
     # Read input
-    bins, batch = read_instance(id)
+    bins, batch = context.instance()
 
     number_of_items = sum(len(stack.sequence) for stack in batch.stacks)
     placed_items = 0
 
     # Construct the root and the residual
-    current_node = start_new_bin(bins, trees)
-
-    # While there are items to cut
-    while batch.stacks:
-        min_items: list[Item] = []
-
-        # Solve with backtrack
-        id_to_reset = trees[-1].last_descendant().id + 1
-        backtrack(
-            batch.stacks,
-            [],
-            0,
-            min_items,
-            current_node,
-            max_depth,
-            extended_waste_calculation,
-        )
-        Node.reset_id_counter(id_to_reset)
-
-        # If no item could be cut
-        if not min_items:
-            # Finish the previous tree
-            make_node(current_node).type = -1
-            while current_node.parent != current_node:
-                current_node = current_node.parent
-                make_node(current_node).type = -1
-
-            # Start new tree
-            current_node = start_new_bin(bins, trees)
-
-        # Cut items
-        if cut_all:
-            for current_item in min_items:
+    current_node = start_new_bin(bins, trees, writer)
+
+    memo = TranspositionTable(memo_size) if memo_size > 0 else None
+    executor: Executor | None = None
+    if workers > 1:
+        pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+        executor = pool(max_workers=workers)
+    pruned = 0
+    hint: list[Item] = []
+
+    try:
+        # While there are items to cut
+        while batch.stacks:
+            min_items: list[Item] = []
+
+            if deadline is not None and perf_counter() > deadline:
+                raise TimeoutError(f"Backtrack solve of {context.id} ran out of time")
+
+            # Solve with backtrack
+            id_to_reset = trees[-1].last_descendant().id + 1
+            bound = SearchBound(
+                params.max_waste,
+                prune,
+                move_order=move_order,
+                hint=hint,
+                max_nodes=max_nodes,
+                stop_time=(
+                    None if lookahead_time is None else perf_counter() + lookahead_time
+                ),
+            )
+            if executor is not None:
+                parallel_backtrack(
+                    executor,
+                    batch.stacks,
+                    min_items,
+                    current_node,
+                    max_depth,
+                    extended_waste_calculation,
+                    memo_size,
+                    bound,
+                    params,
+                )
+            else:
+                backtrack(
+                    batch.stacks,
+                    [],
+                    0,
+                    min_items,
+                    current_node,
+                    max_depth,
+                    extended_waste_calculation,
+                    use_undo_log,
+                    memo,
+                    deadline,
+                    bound,
+                    params,
+                )
+            trees[-1].ids.reset(id_to_reset)
+            pruned += bound.pruned
+            context.expanded_nodes += bound.nodes
+
+            # If no item could be cut
+            if not min_items:
+                # Finish the previous tree
+                close_plate(current_node)
+
+                # Start new tree
+                current_node = start_new_bin(bins, trees, writer)
+
+            # Cut items
+            if cut_all:
+                for current_item in min_items:
+                    for stack in batch.stacks:
+                        if stack.sequence and stack.sequence[0].id == current_item.id:
+                            if context.events is not None:
+                                placed_items += 1
+                                context.report_progress(
+                                    placed_items, number_of_items, trees
+                                )
+                            stack.sequence.pop(0)
+                            current_node, _ = place_item(
+                                current_item, current_node, params
+                            )
+            elif min_items:
+                current_item = min_items[0]
                 for stack in batch.stacks:
                     if stack.sequence and stack.sequence[0].id == current_item.id:
-                        if to_log:
+                        if context.events is not None:
                             placed_items += 1
-                            draw_loading_bar(number_of_items, placed_items)
+                            context.report_progress(
+                                placed_items, number_of_items, trees
+                            )
                         stack.sequence.pop(0)
-                        current_node, _ = place_item(current_item, current_node)
-        elif min_items:
-            current_item = min_items[0]
-            for stack in batch.stacks:
-                if stack.sequence and stack.sequence[0].id == current_item.id:
-                    if to_log:
-                        placed_items += 1
-                        draw_loading_bar(number_of_items, placed_items)
-                    stack.sequence.pop(0)
-                    current_node, _ = place_item(current_item, current_node)
-
-        # Drop empty stacks
-        batch.stacks = [stack for stack in batch.stacks if stack.sequence]
-
-    # If the last node is not the root, all nodes to the root should be waste
-    while current_node.parent != current_node:
-        make_node(current_node).type = -1
-        current_node = current_node.parent
+                        current_node, _ = place_item(current_item, current_node, params)
+
+            # The rest of the best branch is tried first by the next lookahead
+            hint = [] if cut_all else min_items[1:]
+
+            # Drop empty stacks
+            batch.stacks = [stack for stack in batch.stacks if stack.sequence]
+    finally:
+        # Also on a timeout or an error, without waiting for the queued branches
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    # All residuals to the root should be waste, but the root's is the residual
+    close_plate(current_node, last=True)
+
+    # Write out the last tree
+    if writer is not None:
+        writer.write_tree(trees[-1])
 
-    # The last waste is a residual
-    make_node(trees[-1]).type = -3
+    if prune:
+        context.report("message", f"\tPruned {pruned} branches of the lookahead")
 
     # Return solution
-    print(f"\tFinished first fit solve algorithm for {id}")
+    context.report(
+        "finish", f"\tFinished first fit solve algorithm for {context.id}", trees
+    )
     return trees
 
 
-def first_fit_with_rotate(id: str = "A1"):
+def solver_context(id: str, context: SolverContext | None = None) -> SolverContext:
+    """
+    Returns the context of a solve: the given one, or a new one with the
+    instance of id and its lower bounds, which prints the messages and the gap
+    to the lower bound, and draws a loading bar.
+    """
+    if context is None:
+        bins, batch = read_instance(id)
+        context = SolverContext(
+            id, bins, batch, events=console, bounds=analyze_instance(bins, batch)
+        )
+    return context
+
+
+def reached_bound(trees: list[Node], context: SolverContext) -> bool:
+    """
+    Returns whether the solution reaches the lower bound of the context,
+    so it is optimal, and a solver can stop improving it.
+    """
+    return (
+        context.bounds is not None and objective_function(trees) <= context.bounds.waste
+    )
+
+
+def iterative_deepening_solve(
+    id: str = "A1",
+    time_limit: float = 60.0,
+    extended_waste_calculation=False,
+    max_depth: int | None = None,
+    memo_size: int = 0,
+    prune: bool = False,
+    context: SolverContext | None = None,
+):
+    """
+    Solves the glass-cutting problem with backtrack_solve, first with depth 1,
+    then with deeper lookaheads while there is time left from time_limit (seconds).
+
+    The depth 1 solve is always finished, so there is a solution even if it takes
+    longer than time_limit. A deeper solve is dropped when the time runs out.
+    No deeper solve is started, if the solution reaches the lower bound of the
+    context, as it is optimal.
+    Every solve uses the same context, so the instance is read only once.
+
+    Returns:
+        list[Node]: The solution with the smallest objective function value.
+    """
+    deadline = perf_counter() + time_limit
+    context = solver_context(id, context)
+
+    best_trees = backtrack_solve(
+        context.id,
+        1,
+        extended_waste_calculation,
+        memo_size=memo_size,
+        context=context,
+    )
+    best_waste = objective_function(best_trees)
+
+    depth = 2
+    while perf_counter() < deadline and (max_depth is None or depth <= max_depth):
+        if reached_bound(best_trees, context):
+            context.report("message", f"\tReached the lower bound of {context.id}")
+            break
+        try:
+            trees = backtrack_solve(
+                context.id,
+                depth,
+                extended_waste_calculation,
+                memo_size=memo_size,
+                deadline=deadline,
+                prune=prune,
+                context=context,
+            )
+        except TimeoutError:
+            break
+
+        waste = objective_function(trees)
+        if waste < best_waste:
+            best_trees, best_waste = trees, waste
+        depth += 1
+
+    context.report(
+        "message",
+        f"\tFinished iterative deepening for {context.id} at depth {depth - 1}",
+    )
+    return best_trees
+
+
+def first_fit_with_rotate(
+    id: str = "A1",
+    use_undo_log=True,
+    writer: SolutionWriter | None = None,
+    context: SolverContext | None = None,
+):
     """
     Solves the glass-cutting problem with a first fit approach,
     with occasionally rotating the items.
+    If writer is given, every plate is written with it as soon as it is finished.
+
+    If use_undo_log is set, both orientations are tried on the current tree
+    and reverted with an undo log, instead of on deep copies of the tree.
+    If context is given, its instance is solved with its parameters and sinks.
     """
-    print(f"Started first fit solve with rotation algorithm for {id}")
+    context = solver_context(id, context)
+    params = context.params
+    context.report(
+        "start", f"Started first fit solve with rotation algorithm for {context.id}"
+    )
     # trees containts the root nodes of the output
     trees: list[Node] = []
 
     # Read input
-    bins, batch = read_instance(id)
+    bins, batch = context.instance()
 
     # Construct the root and the residual
-    current_node = start_new_bin(bins, trees)
+    current_node = start_new_bin(bins, trees, writer)
 
     # While there are items to cut
     while batch.stacks:
@@ -134,88 +343,114 @@ def first_fit_with_rotate(id: str = "A1"):
             # Save current id
             id_to_continue: int = trees[-1].last_descendant().id + 1
 
-            # Make a copy for each case, so we can try both
-            node_for_original = deepcopy(current_node)
-            node_for_rotated = deepcopy(current_node)
-
-            # Run the place_item for the original item
-            node_for_original, original_success = place_item(
-                current_item, node_for_original
-            )
-
-            # Make a rotated version of the item, and run place_item on it
+            # Make a rotated version of the item
             rotated_item = copy(current_item)
             rotated_item.rotate()
-            node_for_rotated, rotated_success = place_item(
-                rotated_item, node_for_rotated
+
+            # Try both orientations, and get the waste of each
+            original_waste, rotated_waste = try_orientations(
+                current_item, rotated_item, current_node, use_undo_log, params
             )
 
             # If none of them could be cut
-            if not original_success and not rotated_success:
-                Node.reset_id_counter(id_to_continue)
+            if original_waste is None and rotated_waste is None:
+                current_node.ids.reset(id_to_continue)
 
                 # Finish current bin
-                _, _ = place_item(current_item, current_node)
-                current_node = start_new_bin(bins, trees)
+                _, _ = place_item(current_item, current_node, params)
+                current_node = start_new_bin(bins, trees, writer)
                 id_to_continue = current_node.id + 1
 
-                node_for_original = deepcopy(current_node)
-                node_for_rotated = deepcopy(current_node)
-
-                # Run the place_item for the original item
-                node_for_original, original_success = place_item(
-                    current_item, node_for_original
+                original_waste, rotated_waste = try_orientations(
+                    current_item, rotated_item, current_node, use_undo_log, params
                 )
 
-                # Run place_item for the rotated item
-                node_for_rotated, rotated_success = place_item(
-                    rotated_item, node_for_rotated
-                )
-
-            Node.reset_id_counter(id_to_continue)
+            current_node.ids.reset(id_to_continue)
 
             # If only one could be cut
-            if original_success and not rotated_success:
-                current_node, _ = place_item(current_item, current_node)
-            elif rotated_success and not original_success:
-                current_node, _ = place_item(rotated_item, current_node)
+            if original_waste is not None and rotated_waste is None:
+                current_node, _ = place_item(current_item, current_node, params)
+            elif rotated_waste is not None and original_waste is None:
+                current_node, _ = place_item(rotated_item, current_node, params)
 
             # If both could be cut
-            elif sum_waste_area(node_for_original.get_root()) <= sum_waste_area(
-                node_for_rotated.get_root()
-            ):
-                current_node, _ = place_item(current_item, current_node)
+            elif original_waste <= rotated_waste:
+                current_node, _ = place_item(current_item, current_node, params)
             else:
-                current_node, _ = place_item(rotated_item, current_node)
+                current_node, _ = place_item(rotated_item, current_node, params)
 
-    # If the last node is not the root, all nodes to the root should be waste
-    while current_node.parent != current_node:
-        make_node(current_node).type = -1
-        current_node = current_node.parent
+    # All residuals to the root should be waste, but the root's is the residual
+    close_plate(current_node, last=True)
 
-    # The last waste is a residual
-    make_node(trees[-1]).type = -3
+    # Write out the last tree
+    if writer is not None:
+        writer.write_tree(trees[-1])
 
     # Return solution
-    print(f"\tFinished first fit solve algorithm for {id}")
+    context.report(
+        "finish", f"\tFinished first fit solve algorithm for {context.id}", trees
+    )
 
     return trees
 
 
-def first_fit_solve(id: str = "A1"):
+def try_orientations(
+    current_item: Item,
+    rotated_item: Item,
+    current_node: Node,
+    use_undo_log=True,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Tuple[int | None, int | None]:
+    """
+    Tries to place the item in both orientations without changing the tree.
+    A square item is only tried once, and gets the same waste in both.
+
+    Returns:
+        Tuple[int | None, int | None]: The waste area of the plate after placing
+        the original and the rotated item, or None if it could not be cut.
+    """
+    items = (current_item, rotated_item)
+    if current_item.width == current_item.length:
+        items = (current_item,)
+
+    wastes = []
+    for item in items:
+        if use_undo_log:
+            # Place the item on the tree itself, and revert it afterwards
+            undo_log = snapshot_chain(current_node)
+            node, success = place_item(item, current_node, params)
+            wastes.append(node.get_root().waste_area if success else None)
+            restore_chain(undo_log)
+        else:
+            # Place the item on a copy of the tree
+            node, success = place_item(item, deepcopy(current_node), params)
+            wastes.append(node.get_root().waste_area if success else None)
+
+    return wastes[0], wastes[-1]
+
+
+def first_fit_solve(
+    id: str = "A1",
+    writer: SolutionWriter | None = None,
+    context: SolverContext | None = None,
+):
     """
     Solves the glass-cutting problem with a first fit approach,
     without rotating the items.
+    If writer is given, every plate is written with it as soon as it is finished.
+    If context is given, its instance is solved with its parameters and sinks.
     """
-    print(f"Started first fit solve algorithm for {id}")
+    context = solver_context(id, context)
+    params = context.params
+    context.report("start", f"Started first fit solve algorithm for {context.id}")
     # trees containts the root nodes of the output
     trees: list[Node] = []
 
     # Read input
-    bins, batch = read_instance(id)
+    bins, batch = context.instance()
 
     # Construct the root and the residual
-    current_node = start_new_bin(bins, trees)
+    current_node = start_new_bin(bins, trees, writer)
 
     # While there are items to cut
     while batch.stacks:
@@ -227,263 +462,584 @@ def first_fit_solve(id: str = "A1"):
             # Remove first item from current_stack
             current_item: Item = current_stack.sequence.pop(0)
 
-            current_node, success = place_item(current_item, current_node)
+            current_node, success = place_item(current_item, current_node, params)
             while not success:
-                current_node = start_new_bin(bins, trees)
-                current_node, success = place_item(current_item, current_node)
+                current_node = start_new_bin(bins, trees, writer)
+                current_node, success = place_item(current_item, current_node, params)
 
-    # If the last node is not the root, all nodes to the root should be waste
-    while current_node.parent != current_node:
-        make_node(current_node).type = -1
-        current_node = current_node.parent
+    # All residuals to the root should be waste, but the root's is the residual
+    close_plate(current_node, last=True)
+
+    # Write out the last tree
+    if writer is not None:
+        writer.write_tree(trees[-1])
+
+    # Return solution
+    context.report(
+        "finish", f"\tFinished first fit solve algorithm for {context.id}", trees
+    )
+    return trees
 
-    # The last waste is a residual
-    make_node(trees[-1]).type = -3
+
+def beam_solve(
+    id: str = "A1", beam_width: int = 10, context: SolverContext | None = None
+):
+    """
+    Solves the glass-cutting problem with a beam search.
+
+    Keeps the beam_width best partial solutions, and advances all of them
+    by one item in each step, trying every stack head in both orientations.
+    The partial solutions are scored by their waste plus their open residuals,
+    like the extended waste calculation of backtrack.
+    If context is given, its instance is solved with its parameters and sinks.
+    """
+    context = solver_context(id, context)
+    params = context.params
+    context.report("start", f"Started beam solve algorithm for {context.id}")
+
+    # Read input
+    bins, batch = context.instance()
+    stacks = batch.stacks
+    number_of_items = sum(len(stack.sequence) for stack in stacks)
+
+    root = bin_root(bins[0])
+    beam = [BeamState([root], root, (0,) * len(stacks), 1)]
+
+    # Place one item in every step
+    for _ in range(number_of_items):
+        # Score every move of every state without changing them
+        moves = []
+        for state_ind, state in enumerate(beam):
+            context.expanded_nodes += 1
+            state_moves = beam_moves(state, stacks, params)
+
+            # If no item could be cut, finish the plate and start a new one
+            if not state_moves:
+                close_plate(state.current_node)
+                state.current_node = bin_root(
+                    bins[state.next_bin], state.current_node.ids
+                )
+                state.trees.append(state.current_node)
+                state.next_bin += 1
+                state_moves = beam_moves(state, stacks, params)
+
+            moves.extend(
+                (score, state_ind, stack_ind, item)
+                for score, stack_ind, item in state_moves
+            )
+
+        if not moves:
+            raise ValueError(
+                f"An item of {context.id} cannot be cut from an empty plate"
+            )
+
+        # Keep the best moves, and make a new state from each
+        moves.sort(key=lambda move: (move[0], move[1]))
+        new_beam = []
+        for score, state_ind, stack_ind, item in moves[:beam_width]:
+            state = beam[state_ind]
+            current_node, _ = place_item(item, deepcopy(state.current_node), params)
+            positions = list(state.positions)
+            positions[stack_ind] += 1
+            new_beam.append(
+                BeamState(
+                    trees=state.trees[:-1] + [current_node.get_root()],
+                    current_node=current_node,
+                    positions=tuple(positions),
+                    next_bin=state.next_bin,
+                    score=score,
+                )
+            )
+        beam = new_beam
+
+    # Take the best solution
+    best_state = min(beam, key=lambda state: state.score)
+    trees = best_state.trees
+    current_node = best_state.current_node
+
+    # All residuals to the root should be waste, but the root's is the residual
+    close_plate(current_node, last=True)
+
+    # The states were built in parallel, so number the nodes in output order
+    renumber_nodes(trees)
 
     # Return solution
-    print(f"\tFinished first fit solve algorithm for {id}")
+    context.report("finish", f"\tFinished beam solve algorithm for {context.id}", trees)
     return trees
 
 
-def place_item(current_item: Item, current_node: Node) -> Tuple[Node, bool]:
+def beam_moves(
+    state: BeamState, stacks: list[Stack], params: GlobalParams = DEFAULT_PARAMS
+) -> list[tuple[int, int, Item]]:
+    """
+    Tries every stack head in both orientations on the open plate of the state,
+    and reverts them with an undo log.
+
+    Returns:
+        list[tuple[int, int, Item]]: (score, stack index, item) of each item that could be cut.
+    """
+    # Waste of the closed plates
+    closed_waste = sum(tree.waste_area for tree in state.trees[:-1])
+
+    moves = []
+    for stack_ind, stack in enumerate(stacks):
+        if state.positions[stack_ind] == len(stack.sequence):
+            continue
+
+        current_item = stack.sequence[state.positions[stack_ind]]
+        rotated_item = copy(current_item)
+        rotated_item.rotate()
+
+        for item in (current_item, rotated_item):
+            undo_log = snapshot_chain(state.current_node)
+            node, success = place_item(item, state.current_node, params)
+            if success:
+                score = (
+                    closed_waste + node.get_root().waste_area + open_residual_area(node)
+                )
+                moves.append((score, stack_ind, item))
+            restore_chain(undo_log)
+
+    return moves
+
+
+def local_search(
+    trees: list[Node],
+    id: str = "A1",
+    time_limit: float = 10.0,
+    seed: int = 0,
+    context: SolverContext | None = None,
+) -> list[Node]:
+    """
+    Improves a solution by rebuilding its plates from a plate k on.
+
+    The items of these plates are the remaining parts of the stacks, so they
+    are cut again from the same bins by first_fit_with_rotate or backtrack_solve,
+    with the stacks in a random order. The new plates replace the old ones,
+    if their waste is smaller, so only the rebuilt plates are evaluated.
+    k goes from the last plate to the first, and starts again from the last
+    after an improvement, until time_limit (seconds) runs out, or the solution
+    reaches the lower bound of the context.
+
+    Returns:
+        list[Node]: The improved solution, the given trees are not changed.
+    """
+    deadline = perf_counter() + time_limit
+    context = solver_context(id, context)
+    random = Random(seed)
+    trees = list(trees)
+    waste_before = objective_function(trees)
+
+    # The solver and its arguments to rebuild the plates with, used in turn
+    rebuilds = [
+        (first_fit_with_rotate, {}),
+        (backtrack_solve, {}),
+        (backtrack_solve, {"move_order": largest_area_first}),
+        (backtrack_solve, {"move_order": exact_fit_first}),
+    ]
+    attempts = improvements = 0
+
+    k = len(trees) - 1
+    # Number of rebuilds tried from plate k
+    tries = 0
+    while perf_counter() < deadline and not reached_bound(trees, context):
+        # Items of the plates from k on, left in their stacks
+        placed = {row.type for tree in trees[k:] for row in tree_rows(tree)}
+        stacks = [
+            Stack(stack.id, [item for item in stack.sequence if item.id in placed])
+            for stack in context.batch.stacks
+        ]
+        stacks = [stack for stack in stacks if stack.sequence]
+        random.shuffle(stacks)
+
+        solver, arguments = rebuilds[tries % len(rebuilds)]
+        attempts += 1
+        tries += 1
+        if solver is backtrack_solve:
+            arguments = {**arguments, "deadline": deadline}
+
+        # The plates of a solution use the bins in order
+        rebuild_context = SolverContext(
+            context.id, context.bins[k:], Batch(stacks), context.params
+        )
+        try:
+            new_trees = solver(context.id, context=rebuild_context, **arguments)
+        except TimeoutError:
+            break
+        context.expanded_nodes += rebuild_context.expanded_nodes
+
+        if objective_function(new_trees) < objective_function(trees[k:]):
+            trees[k:] = new_trees
+            improvements += 1
+            k, tries = len(trees) - 1, 0
+        elif tries == len(rebuilds):
+            # Every rebuild was tried, go to the previous plate
+            k = k - 1 if k > 0 else len(trees) - 1
+            tries = 0
+
+    # The rebuilt plates numbered their nodes from 0
+    renumber_nodes(trees)
+
+    context.report(
+        "message",
+        f"\tLocal search of {context.id}: waste {waste_before} -> "
+        f"{objective_function(trees)}, {improvements} improvements "
+        f"in {attempts} rebuilds",
+    )
+    return trees
+
+
+def close_plate(current_node: Node, last: bool = False):
+    """
+    Makes a waste from the residuals from current_node up to the root.
+    Empty residuals are skipped, as a node can not be empty.
+    If last is set, the plate is the last one of the solution, and the
+    residual of its root is the residual of the solution, not a waste.
+    """
+    while True:
+        if current_node.residual.width != 0 and current_node.residual.height != 0:
+            node = make_node(current_node)
+            if last and current_node.parent is current_node:
+                node.type = -3
+            else:
+                node.mark_waste()
+        if current_node.parent is current_node:
+            break
+        current_node = current_node.parent
+
+
+def renumber_nodes(trees: list[Node]):
+    """
+    Numbers the nodes of the trees in the order of the solution file,
+    and continues the ID counter of the last tree after them.
+    """
+    next_id = 0
+    for root in trees:
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            node.id = next_id
+            next_id += 1
+            nodes.extend(reversed(node.children))
+    trees[-1].ids.reset(next_id)
+
+
+def place_item(
+    current_item: Item, current_node: Node, params: GlobalParams = DEFAULT_PARAMS
+) -> Tuple[Node, bool]:
     """
     Places the given item in first fitting position.
     If it can place it, then do it, and return [item's parent, True]
     If can't, then return [root, False]
-    """
 
-    # Find place starting from bottom left corner
-    x, y = current_node.residual.find_place(
-        current_item.width, current_item.length, current_node.cut % 2 == 0
-    )
+    Every step cuts the node at its cut level with one of the place_*_cut
+    functions, and returns the node where the placement continues from,
+    until the item is placed, or the root has no room for it.
+    """
+    while True:
+        # Find place starting from bottom left corner
+        x, y = current_node.residual.find_place(
+            current_item.width, current_item.length, current_node.cut % 2 == 0
+        )
 
-    # If there is no space
-    if x == -1:
-        # If there is no residual left, we don't need to make a waste from it
-        if current_node.residual.width == 0 or current_node.residual.height == 0:
+        # If there is no space
+        if x == -1:
+            # If there is no residual left, we don't need to make a waste from it
+            if current_node.residual.width != 0 and current_node.residual.height != 0:
+                # Make a waste node from its residual
+                make_node(current_node).mark_waste()
             # If this is the root
-            if current_node.parent == current_node:
+            if current_node.parent is current_node:
                 return current_node, False
-            else:
-                return place_item(current_item, current_node.parent)
+            current_node = current_node.parent
+            continue
 
-        # Make a waste node from its residual
-        make_node(current_node).type = -1
-        # If this is the root
-        if current_node.parent == current_node:
-            return current_node, False
-        else:
-            return place_item(current_item, current_node.parent)
-
-    match current_node.cut:
-        case 0:  #  1-cut (vertical)
-
-            # If there is a waste to the left
-            if x != current_node.residual.x:
-                cut_place = x
-                # If the cut would be too small
-                if x - current_node.residual.x < MIN_1_CUT:
-                    cut_place = find_right_to_x(
-                        current_node, current_node.residual.x + MIN_1_CUT
-                    )
-
-                # If the remaining residual would be too small, go for 2-cut
-                if (
-                    current_node.residual.x + current_node.residual.width - cut_place
-                    < MIN_WASTE
-                ):
-                    child_node = make_node(current_node)
-                    return place_item(current_item, child_node)
-
-                # Cut a big enough column, and solve for the remaining part
-                waste_node = vertical_cut(current_node, cut_place)
-                waste_node.type = -1
-                return place_item(current_item, current_node)
-
-            cut_place = find_right_to_x(current_node, x + current_item.width)
-
-            # If the cut would be smaller than the minimum
-            if cut_place - current_node.residual.x < MIN_1_CUT:
-                # Find the smallest x were we can cut
-                cut_place = find_right_to_x(
-                    current_node,
-                    current_node.residual.x + MIN_1_CUT,
+        match current_node.cut:
+            case 0:
+                current_node, placed = place_1_cut(
+                    current_item, current_node, x, params
                 )
-
-            # If the remaining residual would be too small
-            if (
-                current_node.residual.x + current_node.residual.width - cut_place
-                < MIN_WASTE
-            ):
-                child_node = make_node(current_node)
-                return place_item(current_item, child_node)
-
-            child_node = vertical_cut(current_node, cut_place)
-
-            # If the cut was perfect
-            if (
-                child_node.residual.height == current_item.length
-                and child_node.residual.width == current_item.width
-            ):
-                child_node.type = current_item.id
-                return (current_node, True)
-
-            return place_item(current_item, child_node)
-
-        case 1:  #  2-cut (horizontal)
-
-            # If there is a waste
-            if y != current_node.residual.y:
-                cut_place = y
-                # If the cut would be too small
-                if y - current_node.residual.y < MIN_2_CUT:
-                    cut_place = find_up_to_y(
-                        current_node, current_node.residual.y + MIN_2_CUT
-                    )
-
-                # If the remaining residual would be too small, go to 3-cut
-                if (
-                    current_node.residual.y + current_node.residual.height - cut_place
-                    < MIN_WASTE
-                ):
-                    child_node = make_node(current_node)
-                    return place_item(current_item, child_node)
-
-                # Cut a big enough column, and solve for the remaining part
-                waste_node = horizontal_cut(current_node, cut_place)
-                waste_node.type = -1
-                return place_item(current_item, current_node)
-
-            cut_place = find_up_to_y(current_node, y + current_item.length)
-
-            # If the cut would be smaller than the minimum
-            if cut_place - current_node.residual.y < MIN_2_CUT:
-                # Find the smallest x where we can cut
-                cut_place = find_up_to_y(
-                    current_node, current_node.residual.x + MIN_2_CUT
+            case 1:
+                current_node, placed = place_2_cut(
+                    current_item, current_node, y, params
+                )
+            case 2:
+                current_node, placed = place_3_cut(
+                    current_item, current_node, x, params
                 )
+            case 3:
+                current_node, placed = place_4_cut(current_item, current_node, params)
 
-            # If the remaining residual would be too small (in height)
-            if (
-                current_node.residual.y + current_node.residual.height - cut_place
-                < MIN_WASTE
-            ):
-                child_node = make_node(current_node)
-                return place_item(current_item, child_node)
-
-            child_node = horizontal_cut(current_node, cut_place)
-
-            # If the cut was perfect
-            if (
-                child_node.residual.width == current_item.width
-                and child_node.residual.height == current_item.length
-            ):
-                child_node.type = current_item.id
-                return (current_node, True)
-
-            return place_item(current_item, child_node)
-
-        case 2:  # 3-cut (vertical)
-
-            # If there is a waste at left-side
-            if x != current_node.residual.x:
-                cut_place = x
-                # If the waste would be too small
-                if x - current_node.residual.x < MIN_WASTE:
-                    cut_place = find_right_to_x(
-                        current_node, current_node.residual.x + MIN_WASTE
-                    )
-
-                if (
-                    current_item.length  # If the size is not perfect
-                    != current_node.residual.x + current_node.residual.width - cut_place
-                    < MIN_WASTE  # and the waste would be too small
-                ):
-                    # This is a waste
-                    make_node(current_node).type = -1
-                    return place_item(current_item, current_node.parent)
-
-                # Cut a big enough column, and solve for the remaining part
-                waste_node = vertical_cut(current_node, cut_place).type = -1
-                return place_item(current_item, current_node)
-
-            # GOAL: perfectly cut the item (which can be perfect from the start)
-
-            cut_place = find_right_to_x(current_node, x + current_item.width)
-
-            # If no vertical cut needed
-            if cut_place == current_node.residual.x + current_node.residual.width:
-                # Do 4-cut
-                child_node = make_node(current_node)
-                return place_item(current_item, child_node)
-
-            # If the width is perfect
-            if cut_place == x + current_item.width:
-                # If the remaining residual would be too small
-                if (
-                    current_node.residual.x + current_node.residual.width - cut_place
-                    < MIN_WASTE
-                ):
-                    # this is a waste
-                    make_node(current_node).type = -1
-                    return place_item(current_item, current_node.parent)
-
-                child_node = vertical_cut(current_node, cut_place)
-
-                # If the cut was perfect
-                if (
-                    child_node.residual.height == current_item.length
-                    and child_node.residual.width == current_item.width
-                ):
-                    child_node.type = current_item.id
-                    return (current_node, True)
-
-            else:  # cut was not perfect -> cut a waste column from the left side
-                cut_place = find_right_to_x(current_node, x + MIN_WASTE)
-
-                # Check for valid cut
-                if (
-                    # If after cutting the left part off, the right part is correctly sized
-                    current_node.residual.x + current_node.residual.width - cut_place
-                    == current_item.width
-                    # Or if there is enough for waste after cutting the left part
-                    or current_node.residual.x + current_node.residual.width - cut_place
-                    >= MIN_WASTE
-                ):
-                    # Cut off the left (waste) part
-                    vertical_cut(current_node, cut_place).type = -1
-
-                    # Try to place the item in the remaining part
-                    return place_item(current_item, current_node)
-
-                else:  # there would not be enough space on the right part
-                    # This is a waste
-                    make_node(current_node).type = -1
-                    return place_item(current_item, current_node.parent)
-
-        case 3:  # Instead of 4-cut, do trimming
-
-            if current_item.length == current_node.height:
-                current_node.type = current_item.id
-                return current_node.parent, True
-
-            current_node, success = trim(current_node, current_item)
-            if success:
-                return current_node, success
-            # Go up until we find usable residuals, and try to cut from it
-            while (
-                current_node.parent != current_node and current_node.residual.width == 0
-            ):
-                current_node = current_node.parent
-            if current_node.residual.width != 0:
-                return place_item(current_item, current_node)
-            # If haven't found, than this item won't fit in this bin
-            return current_node, False
+        if placed is not None:
+            return current_node, placed
+
+
+def place_1_cut(
+    current_item: Item,
+    current_node: Node,
+    x: int,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Tuple[Node, bool | None]:
+    """
+    Makes the next vertical 1-cut of a plate towards the place of the item.
+
+    Parameters:
+        current_item (Item): The item to place.
+        current_node (Node): The plate, cut at level 0.
+        x (int): The x-coordinate where the item fits.
+
+    Returns:
+        Tuple[Node, bool | None]: The node where the placement continues from,
+        and None, or the item's parent and True if the item is placed.
+    """
+    # If there is a waste to the left
+    if x != current_node.residual.x:
+        cut_place = x
+        # If the cut would be too small
+        if x - current_node.residual.x < params.min_1_cut:
+            cut_place = find_right_to_x(
+                current_node, current_node.residual.x + params.min_1_cut
+            )
+
+        # If the remaining residual would be too small, go for 2-cut
+        if (
+            current_node.residual.x + current_node.residual.width - cut_place
+            < params.min_waste
+        ):
+            return make_node(current_node), None
+
+        # Cut a big enough column, and solve for the remaining part
+        waste_node = vertical_cut(current_node, cut_place)
+        waste_node.mark_waste()
+        return current_node, None
+
+    cut_place = find_right_to_x(current_node, x + current_item.width)
+
+    # If the cut would be smaller than the minimum
+    if cut_place - current_node.residual.x < params.min_1_cut:
+        # Find the smallest x were we can cut
+        cut_place = find_right_to_x(
+            current_node,
+            current_node.residual.x + params.min_1_cut,
+        )
+
+    # If the remaining residual would be too small
+    if (
+        current_node.residual.x + current_node.residual.width - cut_place
+        < params.min_waste
+    ):
+        return make_node(current_node), None
+
+    child_node = vertical_cut(current_node, cut_place)
 
-    return place_item(current_item, child_node)
+    # If the cut was perfect
+    if (
+        child_node.residual.height == current_item.length
+        and child_node.residual.width == current_item.width
+    ):
+        child_node.type = current_item.id
+        return current_node, True
 
+    return child_node, None
 
-def start_new_bin(bins: list[Bin], trees: list[Node]) -> Node:
+
+def place_2_cut(
+    current_item: Item,
+    current_node: Node,
+    y: int,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Tuple[Node, bool | None]:
+    """
+    Makes the next horizontal 2-cut of a 1-cut column towards the place of the item.
+
+    Parameters:
+        current_item (Item): The item to place.
+        current_node (Node): The column, cut at level 1.
+        y (int): The y-coordinate where the item fits.
+
+    Returns:
+        Tuple[Node, bool | None]: The node where the placement continues from,
+        and None, or the item's parent and True if the item is placed.
+    """
+    # If there is a waste
+    if y != current_node.residual.y:
+        cut_place = y
+        # If the cut would be too small
+        if y - current_node.residual.y < params.min_2_cut:
+            cut_place = find_up_to_y(
+                current_node, current_node.residual.y + params.min_2_cut
+            )
+
+        # If the remaining residual would be too small, go to 3-cut
+        if (
+            current_node.residual.y + current_node.residual.height - cut_place
+            < params.min_waste
+        ):
+            return make_node(current_node), None
+
+        # Cut a big enough column, and solve for the remaining part
+        waste_node = horizontal_cut(current_node, cut_place)
+        waste_node.mark_waste()
+        return current_node, None
+
+    cut_place = find_up_to_y(current_node, y + current_item.length)
+
+    # If the cut would be smaller than the minimum
+    if cut_place - current_node.residual.y < params.min_2_cut:
+        # Find the smallest x where we can cut
+        cut_place = find_up_to_y(
+            current_node, current_node.residual.x + params.min_2_cut
+        )
+
+    # If the remaining residual would be too small (in height)
+    if (
+        current_node.residual.y + current_node.residual.height - cut_place
+        < params.min_waste
+    ):
+        return make_node(current_node), None
+
+    child_node = horizontal_cut(current_node, cut_place)
+
+    # If the cut was perfect
+    if (
+        child_node.residual.width == current_item.width
+        and child_node.residual.height == current_item.length
+    ):
+        child_node.type = current_item.id
+        return current_node, True
+
+    return child_node, None
+
+
+def place_3_cut(
+    current_item: Item,
+    current_node: Node,
+    x: int,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Tuple[Node, bool | None]:
+    """
+    Makes the next vertical 3-cut of a 2-cut row, to cut the item perfectly.
+
+    Parameters:
+        current_item (Item): The item to place.
+        current_node (Node): The row, cut at level 2.
+        x (int): The x-coordinate where the item fits.
+
+    Returns:
+        Tuple[Node, bool | None]: The node where the placement continues from,
+        and None, or the item's parent and True if the item is placed.
+    """
+    # If there is a waste at left-side
+    if x != current_node.residual.x:
+        cut_place = x
+        # If the waste would be too small
+        if x - current_node.residual.x < params.min_waste:
+            cut_place = find_right_to_x(
+                current_node, current_node.residual.x + params.min_waste
+            )
+
+        if (
+            current_item.length  # If the size is not perfect
+            != current_node.residual.x + current_node.residual.width - cut_place
+            < params.min_waste  # and the waste would be too small
+        ):
+            # This is a waste
+            make_node(current_node).mark_waste()
+            return current_node.parent, None
+
+        # Cut a big enough column, and solve for the remaining part
+        vertical_cut(current_node, cut_place).mark_waste()
+        return current_node, None
+
+    # GOAL: perfectly cut the item (which can be perfect from the start)
+
+    cut_place = find_right_to_x(current_node, x + current_item.width)
+
+    # If no vertical cut needed
+    if cut_place == current_node.residual.x + current_node.residual.width:
+        # Do 4-cut
+        return make_node(current_node), None
+
+    # If the width is perfect
+    if cut_place == x + current_item.width:
+        # If the remaining residual would be too small
+        if (
+            current_node.residual.x + current_node.residual.width - cut_place
+            < params.min_waste
+        ):
+            # this is a waste
+            make_node(current_node).mark_waste()
+            return current_node.parent, None
+
+        child_node = vertical_cut(current_node, cut_place)
+
+        # If the cut was perfect
+        if (
+            child_node.residual.height == current_item.length
+            and child_node.residual.width == current_item.width
+        ):
+            child_node.type = current_item.id
+            return current_node, True
+
+        return child_node, None
+
+    # cut was not perfect -> cut a waste column from the left side
+    cut_place = find_right_to_x(current_node, x + params.min_waste)
+
+    # Check for valid cut
+    if (
+        # If after cutting the left part off, the right part is correctly sized
+        current_node.residual.x + current_node.residual.width - cut_place
+        == current_item.width
+        # Or if there is enough for waste after cutting the left part
+        or current_node.residual.x + current_node.residual.width - cut_place
+        >= params.min_waste
+    ):
+        # Cut off the left (waste) part
+        vertical_cut(current_node, cut_place).mark_waste()
+
+        # Try to place the item in the remaining part
+        return current_node, None
+
+    # there would not be enough space on the right part, this is a waste
+    make_node(current_node).mark_waste()
+    return current_node.parent, None
+
+
+def place_4_cut(
+    current_item: Item, current_node: Node, params: GlobalParams = DEFAULT_PARAMS
+) -> Tuple[Node, bool | None]:
+    """
+    Places the item in a 3-cut node, by trimming it instead of a 4-cut.
+
+    Parameters:
+        current_item (Item): The item to place.
+        current_node (Node): The node, cut at level 3.
+
+    Returns:
+        Tuple[Node, bool | None]: The node where the placement continues from,
+        and None, or the item's parent and True if the item is placed,
+        or the root and False if the item does not fit in this bin.
+    """
+    if current_item.length == current_node.height:
+        current_node.type = current_item.id
+        return current_node.parent, True
+
+    current_node, success = trim(current_node, current_item, params)
+    if success:
+        return current_node, success
+    # Go up until we find usable residuals, and try to cut from it
+    while current_node.parent is not current_node and current_node.residual.width == 0:
+        current_node = current_node.parent
+    if current_node.residual.width != 0:
+        return current_node, None
+    # If haven't found, than this item won't fit in this bin
+    return current_node, False
+
+
+def start_new_bin(
+    bins: list[Bin], trees: list[Node], writer: SolutionWriter | None = None
+) -> Node:
     """
     Creates a new root node from the first bin in `bins` and adds it to `trees`.
 
@@ -493,15 +1049,30 @@ def start_new_bin(bins: list[Bin], trees: list[Node]) -> Node:
     Parameters:
         bins (list[Bin]): List of available bins, from which the first bin is used.
         trees (list): List of tree structures, to which the new root node is added.
+        writer (SolutionWriter): If given, the previous, finished tree is written with it.
 
     Returns:
         Node: The created root node representing the bin.
     """
-    # Take out the first bin from bins
-    bin = bins.pop(0)
+    # Write out the finished tree
+    if writer is not None and trees:
+        writer.write_tree(trees[-1])
+
+    # Take out the first bin from bins, and convert it into a root,
+    # which continues the node IDs of the previous trees
+    root = bin_root(bins.pop(0), trees[-1].ids if trees else None)
+
+    # Append node to tree
+    trees.append(root)
+    return root
 
-    # Convert it into a root
-    root = Node.create_root(
+
+def bin_root(bin: Bin, ids: IdCounter | None = None) -> Node:
+    """
+    Creates a root node with a residual covering the whole bin.
+    Its nodes take their IDs from ids, or from a new counter starting at 0.
+    """
+    return Node.create_root(
         plate_id=bin.id,
         x=0,
         y=0,
@@ -509,13 +1080,10 @@ def start_new_bin(bins: list[Bin], trees: list[Node]) -> Node:
         height=bin.height,
         type=-2,
         cut=0,
-        residual=Residual(0, 0, bin.width, bin.height, bin.defects),
+        residual=Residual(0, 0, bin.width, bin.height, bin.defects, bin.defect_index),
+        ids=ids,
     )
 
-    # Append node to tree
-    trees.append(root)
-    return root
-
 
 def vertical_cut(current_node: Node, x: int) -> Node:
     """
@@ -551,6 +1119,7 @@ def vertical_cut(current_node: Node, x: int) -> Node:
                 current_node.residual.y,
                 current_node.residual.y + current_node.residual.height,
             ),
+            index=current_node.residual.index,
         ),
     )
     current_node.children.append(child_node)
@@ -602,6 +1171,7 @@ def horizontal_cut(current_node: Node, y: int) -> Node:
                 current_node.residual.y,
                 y,
             ),
+            index=current_node.residual.index,
         ),
     )
     current_node.children.append(child_node)
@@ -648,6 +1218,7 @@ def make_node(current_node: Node) -> Node:
             width=current_node.residual.width,
             height=current_node.residual.height,
             defects=current_node.residual.defects,
+            index=current_node.residual.index,
         ),
     )
     current_node.children.append(child_node)
@@ -662,7 +1233,61 @@ def make_node(current_node: Node) -> Node:
     return child_node
 
 
-def trim(current_node: Node, current_item: Item) -> Tuple[Node, bool]:
+def snapshot_chain(current_node: Node) -> list[tuple]:
+    """
+    Saves the mutable state of the nodes from current_node up to the root.
+
+    place_item only modifies the nodes on this chain, every other change is a
+    new node appended to one of their children lists. So restoring this snapshot
+    reverts a placement in O(depth), instead of copying the whole tree.
+
+    Parameters:
+        current_node (Node): The node where the placement starts from.
+
+    Returns:
+        list[tuple]: The undo log, to be passed to restore_chain.
+    """
+    undo_log = []
+    node = current_node
+    while True:
+        residual = node.residual
+        undo_log.append(
+            (
+                node,
+                node.type,
+                node.waste_area,
+                len(node.children),
+                residual.x,
+                residual.y,
+                residual.width,
+                residual.height,
+                residual.defects,
+            )
+        )
+        if node.parent is node:
+            return undo_log
+        node = node.parent
+
+
+def restore_chain(undo_log: list[tuple]):
+    """
+    Reverts the nodes saved by snapshot_chain, and drops every node created since.
+    """
+    for node, type, waste_area, n_children, x, y, width, height, defects in undo_log:
+        node.type = type
+        node.waste_area = waste_area
+        del node.children[n_children:]
+        residual = node.residual
+        residual.x = x
+        residual.y = y
+        residual.width = width
+        residual.height = height
+        residual.defects = defects
+
+
+def trim(
+    current_node: Node, current_item: Item, params: GlobalParams = DEFAULT_PARAMS
+) -> Tuple[Node, bool]:
     """
     Trims the given node by specified dimensions and returns a new trimmed node.
 
@@ -676,8 +1301,8 @@ def trim(current_node: Node, current_item: Item) -> Tuple[Node, bool]:
     """
 
     # If not enough waste after cut
-    if current_node.residual.height - current_item.length < MIN_WASTE:
-        make_node(current_node).type = -1
+    if current_node.residual.height - current_item.length < params.min_waste:
+        make_node(current_node).mark_waste()
         return current_node, False
 
     if current_node.residual.width == current_item.width:
@@ -692,7 +1317,7 @@ def trim(current_node: Node, current_item: Item) -> Tuple[Node, bool]:
             horizontal_cut(current_node, current_node.y + current_item.length).type = (
                 current_item.id
             )
-            make_node(current_node).type = -1
+            make_node(current_node).mark_waste()
 
             return current_node.parent, True
 
@@ -708,13 +1333,13 @@ def trim(current_node: Node, current_item: Item) -> Tuple[Node, bool]:
             # do horizontal cut, and up is suitable
             horizontal_cut(
                 current_node, current_node.y + current_node.height - current_item.length
-            ).type = -1
+            ).mark_waste()
             make_node(current_node).type = current_item.id
 
             return current_node.parent, True
 
     # Cannot place item here with a 4-cut
-    make_node(current_node).type = -1
+    make_node(current_node).mark_waste()
     return current_node.parent, False
 
 
@@ -729,39 +1354,8 @@ def find_right_to_x(current_node: Node, cut_place: int):
     Returns:
         cut_place (int) : The x-coordinate of the first defect-free cutting location.
     """
-    # Check if there are defects in our cut
-    defects = current_node.residual.defects_in(
-        cut_place - 1,
-        cut_place + 1,
-        current_node.residual.y,
-        current_node.residual.y + current_node.residual.height,
-    )
-
-    # Filter out defects that start or end at cut_place #TODO test
-    defects = [
-        defect
-        for defect in defects
-        if not (defect.x == cut_place or defect.x + defect.width == cut_place)
-    ]
-
-    # Move to the right until we can cut
-    while defects:
-        cut_place = max(defect.x + defect.width for defect in defects)
-        defects = current_node.residual.defects_in(
-            cut_place - 1,
-            cut_place + 1,
-            current_node.residual.y,
-            current_node.residual.y + current_node.residual.height,
-        )
-
-        # Filter out defects that start or end at cut_place
-        defects = [
-            defect
-            for defect in defects
-            if not (defect.x == cut_place or defect.x + defect.width == cut_place)
-        ]
-
-    return cut_place
+    # Look up the next cut line, which does not cross a defect
+    return current_node.residual.next_x_cut(cut_place)
 
 
 def find_up_to_y(current_node: Node, cut_place: int):
@@ -775,44 +1369,14 @@ def find_up_to_y(current_node: Node, cut_place: int):
     Returns:
         cut_place (int) : The y-coordinate of the first defect-free cutting location.
     """
-    # Check if there are defects in our cut
-    defects = current_node.residual.defects_in(
-        current_node.residual.x,
-        current_node.residual.x + current_node.residual.width,
-        cut_place - 1,
-        cut_place + 1,
-    )
-
-    # Filter out defects that start or end at cut_place # TODO test
-    defects = [
-        defect
-        for defect in defects
-        if not (defect.y == cut_place or defect.y + defect.height == cut_place)
-    ]
-
-    # Move to the right until we can cut
-    while defects:
-        cut_place = max(defect.y + defect.height for defect in defects)
-        defects = current_node.residual.defects_in(
-            current_node.residual.x,
-            current_node.residual.x + current_node.residual.width,
-            cut_place - 1,
-            cut_place + 1,
-        )
-
-        # Filter out defects that start or end at cut_place
-        defects = [
-            defect
-            for defect in defects
-            if not (defect.y == cut_place or defect.y + defect.height == cut_place)
-        ]
-
-    return cut_place
+    # Look up the next cut line, which does not cross a defect
+    return current_node.residual.next_y_cut(cut_place)
 
 
 def sum_waste_area(root: Node) -> int:
     """
     Calculates the total area of waste nodes in a subtree using depth-first search (DFS).
+    The solvers use the running total in Node.waste_area instead, this recounts it.
 
     Parameters:
         root (Node): The root of the subtree.
@@ -845,20 +1409,45 @@ def backtrack(
     current_node: Node,
     max_depth: int = 1,
     extended_waste_calculation=False,
+    use_undo_log=False,
+    memo: TranspositionTable | None = None,
+    deadline: float | None = None,
+    bound: SearchBound | None = None,
+    params: GlobalParams = DEFAULT_PARAMS,
 ) -> int:
+    """
+    Finds the sequence of the next items, which gives the smallest waste
+    after max_depth placements, and stores it in min_items.
+
+    The smallest waste found so far is kept in bound, which is shared by every
+    level of the search, and min_items is only overwritten by a better branch.
+    If bound.prune is set, the states whose waste_lower_bound is not smaller
+    than the best waste are not searched, and counted in bound.pruned.
+
+    With use_undo_log, the items are placed on current_node's tree and reverted
+    with an undo log, and the stacks are popped and restored in place.
+    Otherwise every branch works on deep copies of the tree and the stacks.
+
+    With memo, the waste of every searched state is stored with its best items,
+    so a state reached again by an other order of placements is not searched again.
+
+    If deadline (a perf_counter time) is passed, raises TimeoutError.
+    Returns the smallest waste of the state, or a lower bound of it, if it is
+    not smaller than the best waste of the search.
+    """
+    if bound is None:
+        bound = SearchBound(params.max_waste)
+
     # If we are too deep, then calculate the waste area and return
     depth_limit = (
         int(log(20000, max(2, (2 * len(stacks))))) if max_depth == -1 else max_depth
     )
     if current_depth == depth_limit:
-        waste = sum_waste_area(current_node.get_root())
+        waste = current_node.get_root().waste_area
 
         if extended_waste_calculation:
             # Sum the wastes up to the root
-            temp_node = current_node
-            while temp_node.parent != temp_node:
-                waste += temp_node.residual.width * temp_node.residual.height
-                temp_node = temp_node.parent
+            waste += open_residual_area(current_node)
 
             # If the stack list is empty
             if not stacks:
@@ -866,82 +1455,118 @@ def backtrack(
                 # the residual node is not a waste
                 waste -= root.residual.width * root.residual.height
 
-        # return waste
-        return waste
+        return record_branch(waste, item_list, min_items, bound)
 
-    # smallest_waste = infinity
-    smallest_waste = MAX_WASTE
+    if deadline is not None and perf_counter() > deadline:
+        raise TimeoutError("Backtrack ran out of time")
 
-    # go through all possible items
-    for stack_ind in range(len(stacks)):
+    # Stop, if the search used up its budget after a branch was found
+    bound.nodes += 1
+    if bound.best_waste < params.max_waste and bound.exhausted():
+        return params.max_waste
 
-        # copy the stacks
-        new_stacks = deepcopy(stacks)
-        current_item = new_stacks[stack_ind].sequence.pop(0)
-        if not new_stacks[stack_ind].sequence:
-            new_stacks.pop(stack_ind)
+    if bound.prune:
+        lower_bound = waste_lower_bound(
+            stacks,
+            current_node,
+            depth_limit - current_depth,
+            extended_waste_calculation,
+        )
+        if lower_bound >= bound.best_waste:
+            bound.pruned += 1
+            return lower_bound
+
+    if memo is not None:
+        key = state_key(stacks, current_node, depth_limit - current_depth)
+        entry = memo.get(key)
+        if entry is not None:
+            waste, best_items = entry
+            # The waste is exact, if the best items of the state are known
+            if best_items is not None:
+                return record_branch(waste, item_list + best_items, min_items, bound)
+            # Otherwise it is a lower bound, search again if it is not enough
+            if waste >= bound.best_waste:
+                return waste
+
+        best_waste_before = bound.best_waste
 
-        item_list.append(current_item)
+    # smallest_waste = infinity
+    smallest_waste = params.max_waste
 
-        # Make a copy for rotated and original case, so we can try both
-        node_for_original = deepcopy(current_node)
-        node_for_rotated = deepcopy(current_node)
+    moves = distinct_moves(
+        stacks,
+        order_moves(stacks, current_node, item_list, bound),
+        depth_limit - current_depth,
+    )
 
-        # Run the place_item for the original item
-        node_for_original, original_success = place_item(
-            current_item, node_for_original
-        )
+    # go through all possible moves
+    for stack_ind, rotated in moves:
 
-        # Make a rotated version of the item, and run place_item on it
-        rotated_item = copy(current_item)
-        rotated_item.rotate()
-        node_for_rotated, rotated_success = place_item(rotated_item, node_for_rotated)
-
-        # If the original could be cut
-        if original_success:
-            orig_waste = backtrack(
-                new_stacks,
+        if use_undo_log:
+            smallest_waste = backtrack_branch_in_place(
+                stacks,
+                stack_ind,
+                rotated,
                 item_list,
-                current_depth + 1,
+                current_depth,
                 min_items,
-                node_for_original,
+                current_node,
                 max_depth,
                 extended_waste_calculation,
+                smallest_waste,
+                memo,
+                deadline,
+                bound,
+                params,
             )
-            if smallest_waste > orig_waste:
-                smallest_waste = orig_waste
-                min_items.clear()
-                min_items.extend(item_list)  # Update the list in place
-                # min_items = deepcopy(item_list)
-
-        # If the rotated could be cut
-        if rotated_success:
-            item_list[-1] = rotated_item
-            rotated_waste = backtrack(
-                new_stacks,
-                item_list,
-                current_depth + 1,
-                min_items,
-                node_for_rotated,
-                max_depth,
-                extended_waste_calculation,
-            )
-            if smallest_waste > rotated_waste:
-                smallest_waste = rotated_waste
-                min_items.clear()
-                min_items.extend(item_list)  # Update the list in place
-                # min_items = deepcopy(item_list)
+        else:
+            # copy the stacks
+            new_stacks = deepcopy(stacks)
+            current_item = new_stacks[stack_ind].sequence.pop(0)
+            if not new_stacks[stack_ind].sequence:
+                new_stacks.pop(stack_ind)
+
+            if rotated:
+                current_item.rotate()
+
+            # Run the place_item on a copy of the tree
+            node, success = place_item(current_item, deepcopy(current_node), params)
+
+            # If the item could be cut
+            if success:
+                item_list.append(current_item)
+                waste = backtrack(
+                    new_stacks,
+                    item_list,
+                    current_depth + 1,
+                    min_items,
+                    node,
+                    max_depth,
+                    extended_waste_calculation,
+                    False,
+                    memo,
+                    deadline,
+                    bound,
+                    params,
+                )
+                smallest_waste = min(smallest_waste, waste)
+                item_list.pop()
+
+        if bound.stopped:
+            break
 
-        item_list.pop()
+    # The result of a stopped search is not complete
+    if bound.stopped:
+        return smallest_waste
 
     # If there was no placeable item
-    if smallest_waste == MAX_WASTE:
-        waste = sum_waste_area(current_node.get_root())
+    if smallest_waste == params.max_waste:
+        waste = current_node.get_root().waste_area
 
         # Sum the wastes up to the root
         temp_node = current_node
         waste += temp_node.residual.width * temp_node.residual.height
-        while temp_node.parent != temp_node:
+        while temp_node.parent is not temp_node:
             temp_node = temp_node.parent
             waste += temp_node.residual.width * temp_node.residual.height
 
@@ -951,16 +1576,472 @@ def backtrack(
             # the residual node is not a waste
             waste -= root.residual.width * root.residual.height
 
+        smallest_waste = record_branch(waste, item_list, min_items, bound)
+
+    if memo is not None:
+        best_items = None
+        # Only a better state than the best before is exact, and wrote min_items
+        if smallest_waste < best_waste_before:
+            best_items = min_items[len(item_list) :]
+        memo.put(key, (smallest_waste, best_items))
+
+    return smallest_waste
+
+
+def record_branch(
+    waste: int, item_list: list[Item], min_items: list[Item], bound: SearchBound
+) -> int:
+    """
+    Stores item_list in min_items, if its waste is smaller than the best one
+    of the search.
+
+    Returns:
+        int: The waste.
+    """
+    if waste < bound.best_waste:
+        bound.best_waste = waste
+        min_items.clear()
+        min_items.extend(item_list)  # Update the list in place
+    return waste
+
+
+def waste_lower_bound(
+    stacks: list[Stack],
+    current_node: Node,
+    remaining_depth: int,
+    extended_waste_calculation=False,
+) -> int:
+    """
+    Calculates a lower bound of the waste backtrack can reach from current_node
+    with remaining_depth more placements.
+
+    The waste of the plate never decreases. With extended_waste_calculation,
+    the open residuals (except the root's) are counted too, and a residual which
+    none of the next remaining_depth items of the stacks fits into, in either
+    orientation, stays open or becomes waste, so its area is added.
+    The root's residual is not counted, if the stacks can run out.
+    """
+    root = current_node.get_root()
+    waste = root.waste_area
+    if not extended_waste_calculation:
         return waste
 
+    sizes = {
+        (item.width, item.length)
+        for stack in stacks
+        for item in stack.sequence[:remaining_depth]
+    }
+
+    node = current_node
+    while node.parent is not node:
+        width, height = node.residual.width, node.residual.height
+        if not any(
+            (w <= width and l <= height) or (l <= width and w <= height)
+            for w, l in sizes
+        ):
+            waste += width * height
+        node = node.parent
+
+    if sum(len(stack.sequence) for stack in stacks) <= remaining_depth:
+        waste -= root.residual.width * root.residual.height
+
+    return waste
+
+
+def parallel_backtrack(
+    executor: Executor,
+    stacks: list[Stack],
+    min_items: list[Item],
+    current_node: Node,
+    max_depth: int = 1,
+    extended_waste_calculation=False,
+    memo_size: int = 0,
+    bound: SearchBound | None = None,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> int:
+    """
+    Runs backtrack from current_node, with each first level branch (stack index
+    and orientation) searched in a separate task of the executor.
+
+    The results are merged in the order of the serial search, so the returned
+    waste and min_items are the same as backtrack would give. If bound.prune is
+    set, every task prunes with the best waste of its own branch.
+    The tasks are not stopped by bound.max_nodes and bound.stop_time.
+    The tasks of a ThreadPoolExecutor search their own copy of the state.
+    """
+    if bound is None:
+        bound = SearchBound(params.max_waste)
+
+    depth_limit = (
+        int(log(20000, max(2, (2 * len(stacks))))) if max_depth == -1 else max_depth
+    )
+
+    # Nothing to branch on, solve it here
+    if depth_limit == 0:
+        return backtrack(
+            stacks,
+            [],
+            0,
+            min_items,
+            current_node,
+            max_depth,
+            extended_waste_calculation,
+            True,
+            bound=bound,
+            params=params,
+        )
+
+    threads = isinstance(executor, ThreadPoolExecutor)
+    futures = []
+    for stack_ind, rotated in distinct_moves(
+        stacks, order_moves(stacks, current_node, [], bound), depth_limit
+    ):
+        # A thread would change the stacks and the tree of the others
+        task_stacks, task_node = (
+            copy_search_state(stacks, current_node)
+            if threads
+            else (stacks, current_node)
+        )
+        futures.append(
+            executor.submit(
+                backtrack_branch_task,
+                task_stacks,
+                stack_ind,
+                rotated,
+                task_node,
+                max_depth,
+                extended_waste_calculation,
+                memo_size,
+                bound.prune,
+                bound.move_order,
+                params,
+            )
+        )
+
+    smallest_waste = params.max_waste
+    for future in futures:
+        waste, best_items, pruned, nodes = future.result()
+        bound.pruned += pruned
+        bound.nodes += nodes
+
+        # If the item could not be cut
+        if waste is None:
+            continue
+
+        smallest_waste = min(smallest_waste, waste)
+        record_branch(waste, best_items, min_items, bound)
+
+    # If there was no placeable item, let backtrack calculate the waste
+    if smallest_waste == params.max_waste:
+        return backtrack(
+            stacks,
+            [],
+            0,
+            min_items,
+            current_node,
+            max_depth,
+            extended_waste_calculation,
+            True,
+            bound=bound,
+            params=params,
+        )
+
+    return smallest_waste
+
+
+def backtrack_branch_task(
+    stacks: list[Stack],
+    stack_ind: int,
+    rotated: bool,
+    current_node: Node,
+    max_depth: int,
+    extended_waste_calculation: bool,
+    memo_size: int,
+    prune: bool = False,
+    move_order: Callable | None = None,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> tuple[int | None, list[Item], int, int]:
+    """
+    Searches one first level branch of backtrack, in a worker process or thread.
+    It changes stacks and the tree of current_node, so they must be its own copies.
+
+    Returns:
+        tuple[int | None, list[Item], int, int]: The smallest waste of the branch,
+        or None if the item could not be cut, the best items of the branch
+        starting with the placed item, and the number of pruned and expanded states.
+    """
+    # Pop the item, and drop its stack if it became empty
+    current_item = stacks[stack_ind].sequence.pop(0)
+    if not stacks[stack_ind].sequence:
+        stacks = stacks[:stack_ind] + stacks[stack_ind + 1 :]
+
+    if rotated:
+        current_item = copy(current_item)
+        current_item.rotate()
+
+    node, success = place_item(current_item, current_node, params)
+    if not success:
+        return None, [current_item], 0, 0
+
+    min_items: list[Item] = []
+    bound = SearchBound(params.max_waste, prune, move_order=move_order)
+    waste = backtrack(
+        stacks,
+        [current_item],
+        1,
+        min_items,
+        node,
+        max_depth,
+        extended_waste_calculation,
+        True,
+        TranspositionTable(memo_size) if memo_size > 0 else None,
+        bound=bound,
+        params=params,
+    )
+
+    return waste, min_items, bound.pruned, bound.nodes
+
+
+def copy_search_state(
+    stacks: list[Stack], current_node: Node
+) -> tuple[list[Stack], Node]:
+    """
+    Copies the stacks and the tree of current_node, for a search in a thread.
+
+    The defects of the bin and their index are never changed, so the copy
+    shares them with the original, instead of copying them.
+    """
+    memo = {}
+    index = current_node.residual.index
+    if index is not None:
+        memo[id(index)] = index
+        memo[id(index.defects)] = index.defects
+        for defect in index.defects:
+            memo[id(defect)] = defect
+    return deepcopy((stacks, current_node), memo)
+
+
+def state_key(stacks: list[Stack], current_node: Node, remaining_depth: int) -> tuple:
+    """
+    Creates a key of a search state for the transposition table.
+
+    The state is defined by the remaining part of the stacks, and the nodes from
+    current_node up to the root with their residuals, as the next placements
+    only depend on these. The waste of the plate is part of it too.
+    """
+    chain = []
+    node = current_node
+    while True:
+        residual = node.residual
+        chain.append(
+            (
+                node.cut,
+                node.x,
+                node.y,
+                node.width,
+                node.height,
+                residual.x,
+                residual.y,
+                residual.width,
+                residual.height,
+            )
+        )
+        if node.parent is node:
+            break
+        node = node.parent
+
+    return (
+        remaining_depth,
+        tuple((stack.id, len(stack.sequence)) for stack in stacks),
+        node.plate_id,
+        node.waste_area,
+        tuple(chain),
+    )
+
+
+def backtrack_branch_in_place(
+    stacks: list[Stack],
+    stack_ind: int,
+    rotated: bool,
+    item_list: list[Item],
+    current_depth: int,
+    min_items: list[Item],
+    current_node: Node,
+    max_depth: int,
+    extended_waste_calculation: bool,
+    smallest_waste: int,
+    memo: TranspositionTable | None = None,
+    deadline: float | None = None,
+    bound: SearchBound | None = None,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> int:
+    """
+    Tries the head of stacks[stack_ind] (rotated, if set) on the shared tree,
+    and reverts every change afterwards.
+
+    Returns:
+        int: The updated smallest waste.
+    """
+    # Pop the item, and drop its stack if it became empty
+    stack = stacks[stack_ind]
+    current_item = stack.sequence.pop(0)
+    new_stacks = stacks
+    if not stack.sequence:
+        new_stacks = stacks[:stack_ind] + stacks[stack_ind + 1 :]
+
+    item = current_item
+    if rotated:
+        item = copy(current_item)
+        item.rotate()
+
+    item_list.append(item)
+    undo_log = snapshot_chain(current_node)
+
+    node, success = place_item(item, current_node, params)
+    if success:
+        waste = backtrack(
+            new_stacks,
+            item_list,
+            current_depth + 1,
+            min_items,
+            node,
+            max_depth,
+            extended_waste_calculation,
+            True,
+            memo,
+            deadline,
+            bound,
+            params,
+        )
+        smallest_waste = min(smallest_waste, waste)
+
+    restore_chain(undo_log)
+    item_list.pop()
+
+    # Put back the item to its stack
+    stack.sequence.insert(0, current_item)
+
     return smallest_waste
 
 
+def order_moves(
+    stacks: list[Stack], current_node: Node, item_list: list[Item], bound: SearchBound
+) -> list[tuple[int, bool]]:
+    """
+    Orders the moves (stack index and rotation) of a backtrack state with
+    bound.move_order, and puts the move of bound.hint first, if the items placed
+    so far are the beginning of the hint.
+    """
+    move_order = stack_order if bound.move_order is None else bound.move_order
+    moves = move_order(stacks, current_node)
+
+    depth = len(item_list)
+    hint = bound.hint
+    if depth < len(hint) and all(
+        placed.id == hinted.id for placed, hinted in zip(item_list, hint)
+    ):
+        for ind, (stack_ind, rotated) in enumerate(moves):
+            item = stacks[stack_ind].sequence[0]
+            width = item.length if rotated else item.width
+            if item.id == hint[depth].id and width == hint[depth].width:
+                moves.insert(0, moves.pop(ind))
+                break
+
+    return moves
+
+
+def distinct_moves(
+    stacks: list[Stack], moves: list[tuple[int, bool]], remaining_depth: int
+) -> list[tuple[int, bool]]:
+    """
+    Drops the moves, which lead to the same wastes as an earlier move:
+    the rotation of a square item, and the move of a stack, whose next
+    remaining_depth + 1 items have the same sizes as those of an earlier stack.
+    """
+    seen = set()
+    distinct = []
+    for stack_ind, rotated in moves:
+        sequence = stacks[stack_ind].sequence
+        if rotated and sequence[0].width == sequence[0].length:
+            continue
+
+        key = (
+            rotated,
+            tuple(
+                (item.width, item.length) for item in sequence[: remaining_depth + 1]
+            ),
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        distinct.append((stack_ind, rotated))
+
+    return distinct
+
+
+def stack_order(stacks: list[Stack], current_node: Node) -> list[tuple[int, bool]]:
+    """
+    Move order of the stacks, the original orientation first.
+    """
+    return [
+        (stack_ind, rotated)
+        for stack_ind in range(len(stacks))
+        for rotated in (False, True)
+    ]
+
+
+def largest_area_first(
+    stacks: list[Stack], current_node: Node
+) -> list[tuple[int, bool]]:
+    """
+    Move order of the stack heads by decreasing area, the original orientation first.
+    """
+
+    def area(move: tuple[int, bool]) -> int:
+        item = stacks[move[0]].sequence[0]
+        return item.width * item.length
+
+    return sorted(stack_order(stacks, current_node), key=area, reverse=True)
+
+
+def exact_fit_first(stacks: list[Stack], current_node: Node) -> list[tuple[int, bool]]:
+    """
+    Move order, which tries the items first, that fit exactly into the width
+    or the height of the current node's residual, otherwise the order of the stacks.
+    """
+    residual = current_node.residual
+
+    def misfit(move: tuple[int, bool]) -> bool:
+        stack_ind, rotated = move
+        item = stacks[stack_ind].sequence[0]
+        width, length = item.width, item.length
+        if rotated:
+            width, length = length, width
+        return width != residual.width and length != residual.height
+
+    return sorted(stack_order(stacks, current_node), key=misfit)
+
+
+def open_residual_area(current_node: Node) -> int:
+    """
+    Sums the residual areas from current_node up to the root, without the root's,
+    as these become waste if the plate is finished.
+    """
+    area = 0
+    while current_node.parent is not current_node:
+        area += current_node.residual.width * current_node.residual.height
+        current_node = current_node.parent
+    return area
+
+
 def objective_function(trees: list[Node]) -> int:
-    return sum(sum_waste_area(tree) for tree in trees)
+    return sum(tree.waste_area for tree in trees)
 
 
 def waste_proportion(trees: list[Node]) -> float:
     return round(
-        100 * objective_function(trees) / (len(trees) * WIDTH_PLATES * HEIGHT_PLATES), 4
+        100
+        * objective_function(trees)
+        / sum(tree.width * tree.height for tree in trees),
+        4,
     )
@@ -0,0 +1,344 @@
+from classes import (
+    Bin,
+    Batch,
+    Node,
+    SolutionRow,
+    Validation,
+    GlobalParams,
+    DEFAULT_PARAMS,
+)
+from input_output import read_instance, read_solution, tree_rows
+
+
+def validate_solution(
+    trees: list[Node],
+    id: str = "A1",
+    base_path: str = "datasets",
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Validation:
+    """
+    Validates the solution trees of an instance, the same way as the checker
+    validates the solution file written from them.
+
+    Parameters:
+        trees (list[Node]): Root nodes of the plates.
+        id (str): Instance ID (e.g., "A1").
+        base_path (str): Path to the main datasets folder.
+        params (GlobalParams): Global parameters of the problem.
+
+    Returns:
+        Validation: The violated constraints and the objective function value.
+    """
+    bins, batch = read_instance(id, base_path, params=params)
+    rows = [row for tree in trees for row in tree_rows(tree)]
+    return validate_rows(rows, bins, batch, params)
+
+
+def validate_solution_file(
+    path: str,
+    id: str = "A1",
+    base_path: str = "datasets",
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Validation:
+    """
+    Validates a solution file of an instance, like the checker.
+
+    Parameters:
+        path (str): Path of the solution file.
+        id (str): Instance ID (e.g., "A1").
+        base_path (str): Path to the main datasets folder.
+        params (GlobalParams): Global parameters of the problem.
+
+    Returns:
+        Validation: The violated constraints and the objective function value.
+    """
+    bins, batch = read_instance(id, base_path, params=params)
+    return validate_rows(read_solution(path), bins, batch, params)
+
+
+def validate_rows(
+    rows: list[SolutionRow],
+    bins: list[Bin],
+    batch: Batch,
+    params: GlobalParams = DEFAULT_PARAMS,
+) -> Validation:
+    """
+    Checks the rows of a solution for the constraints of the checker:
+    the tree structure, the production of the items, the defects, the sequence
+    and identity of the items and the dimensions of the nodes.
+    Then calculates the objective function value.
+
+    As in the checker, an invalid node ID or a negative or empty node stops
+    the validation, and the sequence is not checked if an item is not produced
+    exactly once.
+    """
+    validation = Validation()
+    errors = validation.errors
+
+    plates = build_plates(rows, errors, params)
+    if not plates:
+        return validation
+    validation.plates = len(plates)
+
+    # The rightmost 1-cut node of the last plate is the residual,
+    # even if it is marked as a waste
+    last_children = plates[-1].children
+    if last_children and last_children[-1].type in (-1, -3):
+        validation.residual_width = last_children[-1].width
+    for row in rows:
+        if row.type == -3 and not (last_children and row is last_children[-1]):
+            errors.append(
+                f"Node {row.node_id} is a residual, but not the rightmost 1-cut node "
+                "of the last plate"
+            )
+
+    items = [item for stack in batch.stacks for item in stack.sequence]
+    if check_production(rows, items, errors):
+        check_sequence(plates, batch, errors)
+    check_defects(plates, bins, errors)
+    check_dimensions(plates, validation.residual_width, errors, params)
+
+    validation.objective = (
+        len(plates) * params.width_plates * params.height_plates
+        - validation.residual_width * params.height_plates
+        - sum(item.width * item.length for item in items)
+    )
+    return validation
+
+
+def build_plates(
+    rows: list[SolutionRow], errors: list[str], params: GlobalParams = DEFAULT_PARAMS
+) -> list[SolutionRow]:
+    """
+    Links the rows to their parents, and checks the structure of the trees.
+
+    Returns:
+        list[SolutionRow]: The plates, or an empty list if the rows can not
+        be read as trees.
+    """
+    plates: list[SolutionRow] = []
+    nodes: dict[int, SolutionRow] = {}
+
+    for index, row in enumerate(rows):
+        row.children = []
+        if row.node_id != index:
+            errors.append(f"Node {row.node_id} is read when {index} is expected")
+            return []
+        if (
+            min(row.plate_id, row.x, row.y, row.cut) < 0
+            or row.width <= 0
+            or row.height <= 0
+        ):
+            errors.append(f"Node {row.node_id} has a negative or null attribute")
+            return []
+        if row.cut > 4:
+            errors.append(f"Node {row.node_id} is a {row.cut}-cut, the max is 4")
+
+        if row.parent is None:
+            if row.plate_id != len(plates):
+                errors.append(
+                    f"Plate {row.plate_id} is used when {len(plates)} is expected"
+                )
+            if row.width != params.width_plates or row.height != params.height_plates:
+                errors.append(
+                    f"Plate {row.plate_id} is not "
+                    f"{params.width_plates}x{params.height_plates}"
+                )
+            plates.append(row)
+        else:
+            parent = nodes.get(row.parent)
+            if parent is None or parent.plate_id != row.plate_id:
+                errors.append(f"Node {row.node_id} has no parent {row.parent}")
+                return []
+            if parent.cut > 2 and len(parent.children) >= 2:
+                errors.append(
+                    f"Node {parent.node_id} is {parent.cut}-cut, "
+                    "and has more than 2 successors"
+                )
+            if row.type == -3 and row.cut != 1:
+                errors.append(f"Node {row.node_id} is a residual, but not a 1-cut")
+            parent.children.append(row)
+        nodes[row.node_id] = row
+
+    if len(plates) > params.n_plates:
+        errors.append(f"{len(plates)} plates are used, the max is {params.n_plates}")
+
+    return plates
+
+
+def check_production(rows: list[SolutionRow], items: list, errors: list[str]) -> bool:
+    """
+    Checks that every item of the batch is cut exactly once.
+
+    Returns:
+        bool: Whether every item is cut exactly once.
+    """
+    counts: dict[int, int] = {}
+    for row in rows:
+        if row.type >= 0:
+            counts[row.type] = counts.get(row.type, 0) + 1
+
+    valid = True
+    for item in items:
+        count = counts.get(item.id, 0)
+        if count != 1:
+            errors.append(
+                f"Item {item.id} is " + ("not produced" if count == 0 else "duplicated")
+            )
+            valid = False
+    return valid
+
+
+def item_rows(plates: list[SolutionRow]) -> list[SolutionRow]:
+    """
+    Returns the item nodes in the order the checker reads them: depth-first,
+    through the branch nodes.
+    """
+    items = []
+    for plate in plates:
+        nodes = list(reversed(plate.children))
+        while nodes:
+            node = nodes.pop()
+            if node.type >= 0:
+                items.append(node)
+            elif node.type == -2:
+                nodes.extend(reversed(node.children))
+    return items
+
+
+def check_sequence(plates: list[SolutionRow], batch: Batch, errors: list[str]):
+    """
+    Checks that the items are cut in the order of their stacks,
+    with the sizes of the batch, rotated or not.
+    """
+    positions = [0] * len(batch.stacks)
+    for row in item_rows(plates):
+        for stack_ind, stack in enumerate(batch.stacks):
+            position = positions[stack_ind]
+            if (
+                position < len(stack.sequence)
+                and stack.sequence[position].id == row.type
+            ):
+                break
+        else:
+            errors.append(f"Item {row.type} is cut before the items above it")
+            return
+
+        positions[stack_ind] += 1
+        item = stack.sequence[position]
+        if sorted((row.width, row.height)) != sorted((item.width, item.length)):
+            errors.append(
+                f"Item {row.type} is cut as {row.width}x{row.height}, "
+                f"instead of {item.width}x{item.length}"
+            )
+
+
+def check_defects(plates: list[SolutionRow], bins: list[Bin], errors: list[str]):
+    """
+    Checks that no item overlaps a defect, and no cut goes through a defect,
+    so every defect is inside a single leaf node.
+    """
+    for plate in plates:
+        if not plate.children or plate.plate_id >= len(bins):
+            continue
+        defects = bins[plate.plate_id].defects
+
+        overlaps = 0
+        nodes = list(plate.children)
+        while nodes:
+            node = nodes.pop()
+            if node.children:
+                nodes.extend(node.children)
+                continue
+
+            for defect in defects:
+                if not (
+                    node.x < defect.x + defect.width
+                    and defect.x < node.x + node.width
+                    and node.y < defect.y + defect.height
+                    and defect.y < node.y + node.height
+                ):
+                    continue
+
+                overlaps += 1
+                if node.type >= 0:
+                    errors.append(
+                        f"Item {node.type} (node {node.node_id}) overlaps "
+                        f"defect {defect.id}"
+                    )
+                if not (
+                    node.x <= defect.x
+                    and defect.x + defect.width <= node.x + node.width
+                    and node.y <= defect.y
+                    and defect.y + defect.height <= node.y + node.height
+                ):
+                    errors.append(
+                        f"Defect {defect.id} does not fit entirely in "
+                        f"node {node.node_id}"
+                    )
+
+        if defects and overlaps != len(defects):
+            errors.append(f"A cut is made through a defect on plate {plate.plate_id}")
+
+
+def check_dimensions(
+    plates: list[SolutionRow],
+    residual_width: int,
+    errors: list[str],
+    params: GlobalParams = DEFAULT_PARAMS,
+):
+    """
+    Checks that the children of every branch node cut it into pieces along
+    the direction of their cut level, and that the sizes follow the
+    min_1_cut, max_1_cut, min_2_cut and min_waste limits of params.
+    """
+    if residual_width and residual_width < params.min_waste:
+        errors.append(f"The residual is narrower than {params.min_waste}")
+
+    nodes = list(plates)
+    while nodes:
+        parent = nodes.pop()
+        # Odd cut levels cut along x, even ones along y
+        along_x = parent.cut % 2 == 0
+        # The checker starts the 1-cuts from 0, whatever the x of the plate is
+        start = (0 if parent.parent is None else parent.x) if along_x else parent.y
+        end = start + (parent.width if along_x else parent.height)
+
+        for child in parent.children:
+            name = f"Node {child.node_id}"
+            if child.cut != parent.cut + 1:
+                errors.append(f"{name} is not 1 cut level deeper than its parent")
+
+            if child.type == -2:
+                if (
+                    child.cut == 1
+                    and not params.min_1_cut <= child.width <= params.max_1_cut
+                ):
+                    errors.append(
+                        f"{name} is a 1-cut of width {child.width}, "
+                        f"not between {params.min_1_cut} and {params.max_1_cut}"
+                    )
+                if child.cut == 2 and child.height < params.min_2_cut:
+                    errors.append(
+                        f"{name} is a 2-cut of height {child.height}, "
+                        f"less than {params.min_2_cut}"
+                    )
+                nodes.append(child)
+
+            if child.type == -1 and min(child.width, child.height) < params.min_waste:
+                errors.append(f"{name} is a waste smaller than {params.min_waste}")
+
+            if along_x:
+                same_side = child.y == parent.y and child.height == parent.height
+                position, size = child.x, child.width
+            else:
+                same_side = child.x == parent.x and child.width == parent.width
+                position, size = child.y, child.height
+            if not same_side:
+                errors.append(f"{name} does not span its parent {parent.node_id}")
+            if position != start:
+                errors.append(f"{name} does not start where its previous sibling ends")
+            start = position + size
+
+        if parent.children and start != end:
+            errors.append(f"The children of node {parent.node_id} do not fill it")